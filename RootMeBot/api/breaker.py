@@ -0,0 +1,86 @@
+"""Module for the API circuit breaker"""
+import asyncio
+import random
+import time
+from datetime import datetime
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker():
+    """Stops sending requests to a host after repeated failures or a ban, then probes it again"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name: str, threshold: int, cooldown: float, max_cooldown: float) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_until = 0.0
+        self.probe_started = 0.0
+
+    def _update(self) -> None:
+        """An open breaker becomes half-open once its cooldown is over"""
+        if self.state == self.OPEN and time.monotonic() >= self.opened_until:
+            self.state = self.HALF_OPEN
+            self.probe_started = 0.0
+
+    def available(self) -> bool:
+        """Whether requests can currently go through"""
+        self._update()
+        return self.state != self.OPEN
+
+    async def wait(self) -> None:
+        """Waits until a request may be sent, only one probe at a time goes through when half-open"""
+        while True:
+            self._update()
+            now = time.monotonic()
+
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                await asyncio.sleep(self.opened_until - now)
+            elif now - self.probe_started > self.base_cooldown:
+                #No probe running, or it never reported back
+                self.probe_started = now
+                return
+            else:
+                await asyncio.sleep(1)
+
+    def success(self) -> None:
+        if self.state != self.CLOSED:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Circuit breaker {self.name} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+
+    def failure(self) -> None:
+        self._update()
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN:
+            #The probe failed, wait longer this time
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self.open(self.cooldown)
+        elif self.state == self.CLOSED and self.failures >= self.threshold:
+            self.open(self.cooldown)
+
+    def open(self, duration: float) -> None:
+        """Stops all requests for duration seconds"""
+        self.state = self.OPEN
+        self.opened_until = max(self.opened_until, time.monotonic() + duration)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Circuit breaker {self.name} open for {duration:.0f}s")
+
+    def __str__(self) -> str:
+        self._update()
+        return f"CircuitBreaker {self.name} {self.state} ({self.failures} failures)"
@@ -0,0 +1,128 @@
+"""Module for the persistent API response cache"""
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ResponseCache():
+    """Persistent cache of raw API responses, with a TTL and a LRU size limit per endpoint.
+    Unavailable resources (401/404) are remembered too, and only rechecked after an interval.
+    The database is only used from one thread, so the event loop never waits on the disk"""
+
+    def __init__(self, path: str, policies: dict[str, tuple[int, int]], negative_policies: dict[str, int], access_resolution: int) -> None:
+        self.policies = policies
+        self.negative_policies = negative_policies
+        #Hits less than this many seconds after the last recorded access are not written
+        self.access_resolution = access_resolution
+        self.stats = {endpoint: {'hits': 0, 'misses': 0, 'suppressed': 0} for endpoint in policies}
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache')
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "create table if not exists responses ("
+            "key text primary key, endpoint text not null, body text not null, "
+            "stored_at real not null, accessed_at real not null)"
+        )
+        self.conn.execute("create index if not exists responses_lru on responses (endpoint, accessed_at)")
+        self.conn.execute(
+            "create table if not exists unavailable ("
+            "key text primary key, endpoint text not null, status text not null, checked_at real not null)"
+        )
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def get(self, key: str, endpoint: str) -> str:
+        """Returns a cached body, or None if it is missing or expired"""
+        body = await self.run(self.read, key, self.policies[endpoint][0])
+        self.stats[endpoint]['hits' if body is not None else 'misses'] += 1
+        return body
+
+    def read(self, key: str, ttl: int) -> str:
+        now = time.time()
+
+        row = self.conn.execute("select body, stored_at, accessed_at from responses where key = ?", (key,)).fetchone()
+        if not row or now - row[1] > ttl:
+            return None
+
+        if now - row[2] > self.access_resolution:
+            with self.conn:
+                self.conn.execute("update responses set accessed_at = ? where key = ?", (now, key))
+        return row[0]
+
+    async def put(self, key: str, endpoint: str, body: str) -> None:
+        """Stores a body, evicting the least recently used entries of the endpoint if needed"""
+        await self.run(self.write, key, endpoint, body, self.policies[endpoint][1])
+
+    def write(self, key: str, endpoint: str, body: str, max_entries: int) -> None:
+        now = time.time()
+
+        with self.conn:
+            self.conn.execute(
+                "insert or replace into responses (key, endpoint, body, stored_at, accessed_at) values (?, ?, ?, ?, ?)",
+                (key, endpoint, body, now, now)
+            )
+
+            count, = self.conn.execute("select count(*) from responses where endpoint = ?", (endpoint,)).fetchone()
+            if count > max_entries:
+                self.conn.execute(
+                    "delete from responses where key in "
+                    "(select key from responses where endpoint = ? order by accessed_at asc limit ?)",
+                    (endpoint, count - max_entries)
+                )
+
+            self.conn.execute("delete from unavailable where key = ?", (key,))
+
+    async def get_unavailable(self, key: str, endpoint: str) -> str:
+        """Returns the status of a resource known to be unavailable, or None if it should be requested"""
+        if endpoint not in self.negative_policies:
+            return None
+
+        status = await self.run(self.read_unavailable, key, self.negative_policies[endpoint])
+        if status is not None:
+            self.stats[endpoint]['suppressed'] += 1
+        return status
+
+    def read_unavailable(self, key: str, interval: int) -> str:
+        row = self.conn.execute("select status, checked_at from unavailable where key = ?", (key,)).fetchone()
+        if not row or time.time() - row[1] > interval:
+            return None
+        return row[0]
+
+    async def put_unavailable(self, key: str, endpoint: str, status: str) -> None:
+        """Remembers that a resource is unavailable"""
+        if endpoint not in self.negative_policies:
+            return
+
+        await self.run(self.write_unavailable, key, endpoint, status)
+
+    def write_unavailable(self, key: str, endpoint: str, status: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "insert or replace into unavailable (key, endpoint, status, checked_at) values (?, ?, ?, ?)",
+                (key, endpoint, status, time.time())
+            )
+
+    async def invalidate(self, endpoint: str = None) -> int:
+        """Removes all entries, or only the ones of an endpoint, and returns how many were removed"""
+
+        def query():
+            removed = 0
+            with self.conn:
+                for table in ('responses', 'unavailable'):
+                    if endpoint:
+                        cursor = self.conn.execute(f"delete from {table} where endpoint = ?", (endpoint,))
+                    else:
+                        cursor = self.conn.execute(f"delete from {table}")
+                    removed += cursor.rowcount
+            return removed
+
+        return await self.run(query)
+
+    async def sizes(self) -> dict[str, int]:
+        """Returns the number of stored entries per endpoint"""
+        rows = await self.run(lambda: self.conn.execute("select endpoint, count(*) from responses group by endpoint").fetchall())
+        sizes = {endpoint: 0 for endpoint in self.policies}
+        sizes.update(rows)
+        return sizes
@@ -0,0 +1,39 @@
+"""Module for decoding API responses"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+#Use the fastest JSON library available
+try:
+    import orjson
+    loads = orjson.loads
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+        BACKEND = 'ujson'
+    except ImportError:
+        loads = json.loads
+        BACKEND = 'json'
+
+
+class JsonDecoder():
+    """Decodes JSON payloads, large ones in a thread pool so the event loop keeps running"""
+
+    def __init__(self, threshold: int, workers: int) -> None:
+        self.threshold = threshold
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='json')
+        self.stats = {'inline': 0, 'offloaded': 0}
+
+    async def decode(self, raw: str):
+        """Raises ValueError if raw is not valid JSON"""
+        if len(raw) >= self.threshold:
+            self.stats['offloaded'] += 1
+            return await asyncio.get_running_loop().run_in_executor(self.executor, loads, raw)
+
+        self.stats['inline'] += 1
+        return loads(raw)
+
+    def __str__(self) -> str:
+        return f"JsonDecoder {BACKEND} ({self.stats['inline']} inline, {self.stats['offloaded']} offloaded)"
@@ -6,12 +6,27 @@ from datetime import datetime
 
 from database.models.auteur_model import Auteur
 from database.models.challenge_model import Challenge
-from database.models.validation_model import Validation
+from database.models.validation_model import Validation, epoch_day
 from database.models.base_model import Base
 
 
-def extract_auteur(user_data: dict) -> Auteur:
-    """Parses data to create an Auteur"""
+def validations_since(validations: list, descending: bool, watermark: tuple[str, int]) -> list:
+    """Returns the validations made at or after the watermark date, dates being compared as strings"""
+    last_date, _ = watermark
+
+    if descending:
+        #Most recent first, stop at the first one already seen
+        new_validations = []
+        for validation in validations:
+            if validation['date'] < last_date:
+                break
+            new_validations.append(validation)
+        return new_validations
+
+    return [validation for validation in validations if validation['date'] >= last_date]
+
+def extract_auteur(user_data: dict, watermark: tuple[str, int] = None) -> Auteur:
+    """Parses data to create an Auteur, only with the validations since the watermark (date, count) if given"""
     idx, user_name, user_score = int(user_data['id_auteur']), user_data['nom'], int(user_data['score'])
 
     try:
@@ -22,14 +37,30 @@ def extract_auteur(user_data: dict) -> Auteur:
 
     aut = Auteur(idx=idx, username=user_name, score=user_score, rank=user_rank)
 
-    for validation in user_data['validations']:
+    validations = user_data['validations']
+    descending = bool(validations) and validations[0]['date'] >= validations[-1]['date']
+    if descending:
+        newest = validations[0]['date']
+    else:
+        newest = max((validation['date'] for validation in validations), default='')
+    aut.watermark = (newest, len(validations))
+    aut.fingerprint = f"{user_score}:{user_rank}:{len(validations)}:{newest}:{user_name}"
+
+    if watermark:
+        if len(validations) == watermark[1] and newest <= watermark[0]:
+            #Nothing new since the last time
+            validations = []
+        else:
+            validations = validations_since(validations, descending, watermark)
+
+    for validation in validations:
 
         c = Challenge(idx=int(validation['id_challenge']))
         d = datetime.strptime(validation["date"], "%Y-%m-%d %H:%M:%S")
 
         v_idx = str(aut.idx) + "-" + validation['id_challenge']
 
-        v = Validation(idx = v_idx, date=d)
+        v = Validation(idx = v_idx, date=d, day=epoch_day(d))
         v.validation_auteur = aut
         v.validation_challenge = c
 
@@ -1,18 +1,20 @@
 import asyncio
 import time
 import aiohttp
-import json
-from json.decoder import JSONDecodeError
 import functools
-import uuid
 from datetime import datetime, timedelta
 import random
 import string
+from urllib.parse import urlparse
 
 from asyncio.exceptions import TimeoutError
-from aiohttp.client_exceptions import ServerDisconnectedError, ClientConnectorError, ClientPayloadError, ClientOSError
 
 from api.extract import *
+from api.breaker import CircuitBreaker, backoff_delay
+from api.cache import ResponseCache
+from api.decode import JsonDecoder
+from api.ratelimit import TokenBucket, parse_retry_after
+from api.scheduler import RequestScheduler
 
 from database.models.auteur_model import Auteur
 from database.models.challenge_model import Challenge
@@ -26,21 +28,59 @@ from constants import *
 Auteurs = list[AuteurShort]
 Challenges = list[ChallengeShort]
 
-class PriorityEntry(object):
+class Request():
+    """An API call, shared by every caller waiting for the same result"""
 
-    def __init__(self, priority, data):
-        self.data = data
+    def __init__(self, key: str, method: str, url: str, params: dict, priority: int, conditional: bool) -> None:
+        self.key = key
+        self.method = method
+        self.url = url
+        self.params = params
         self.priority = priority
+        self.conditional = conditional
 
-    def __lt__(self, other):
-        return self.priority < other.priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.queued = False
+        self.started = False
+        self.deadline = 0.0
+        self.retries = API_MAX_RETRIES
+
+    def extend_deadline(self, timeout: float) -> None:
+        """The request is worth trying as long as one of its callers is waiting"""
+        self.deadline = max(self.deadline, time.monotonic() + timeout)
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline"""
+        return self.deadline - time.monotonic()
+
+    def fail(self, reason: str) -> None:
+        """Gives up on the request"""
+        if not self.future.done():
+            self.future.set_exception(RequestFailed(self.url, reason))
+
+    def __str__(self) -> str:
+        return f"Request {self.key} (Priority {self.priority}, {self.waiters} waiting)"
+
+
+class Lane():
+    """Requests to one host, with their own queue, workers and rate budget"""
+
+    def __init__(self, host: str, workers: int, rate: float, burst: int) -> None:
+        self.host = host
+        self.workers = workers
+        self.scheduler = RequestScheduler(API_QUEUE_LIMITS, API_QUEUE_AGING, API_SHED_PRIORITY)
+        self.bucket = TokenBucket(rate, burst, API_RATE_MIN, API_RATE_RECOVER)
+        self.breaker = CircuitBreaker(host, API_BREAKER_THRESHOLD, API_BREAKER_COOLDOWN, API_BREAKER_MAX_COOLDOWN)
+
+    def __str__(self) -> str:
+        return f"Lane {self.host}: {self.workers} workers, {self.bucket}, {self.breaker}, {self.scheduler.qsize()} queued"
 
 
 class ApiRootMe():
     """Class that represents the API"""
     def __init__(self):
         self.bot = None
-        self.semaphore = asyncio.BoundedSemaphore(24)
         self.connector = aiohttp.TCPConnector(limit=24, ttl_dns_cache=300)
         self.session = aiohttp.ClientSession(connector=self.connector)
         self.lang = DEFAULT_LANG
@@ -49,136 +89,328 @@ class ApiRootMe():
         self.userAgent = 'RootMeBotV2-' + ''.join(random.choice(string.ascii_uppercase) for i in range(8))
         self.reqHeaders = {'User-Agent':self.userAgent,"cache-control": "max-age=0"}
 
-        self.queue = asyncio.PriorityQueue()
+        self.lanes = {host: Lane(host, *budget) for host, budget in API_LANES.items()}
+        self.workers = []
+        self.stats = {'requests': 0, 'throttled': 0, 'coalesced': 0, 'not_modified': 0, 'bytes_saved': 0, 'parse_time_saved': 0.0}
 
         self.requests = {}
+        self.validators = {}
+        #Validators of conditional responses, used once the caller applied the response
+        self.pending_validators = {}
 
-    async def worker(self):
-        print(f"Starting worker...")
-        while True:
+        self.cache = ResponseCache(CACHE_PATH, CACHE_POLICIES, NEGATIVE_CACHE_POLICIES, CACHE_ACCESS_RESOLUTION)
+        self.decoder = JsonDecoder(JSON_OFFLOAD_THRESHOLD, JSON_WORKERS)
 
-            check = False
+    def start_workers(self) -> list[asyncio.Task]:
+        """Starts the pool of workers of each lane"""
+        self.workers = [asyncio.create_task(self.worker(lane, i)) for lane in self.lanes.values() for i in range(lane.workers)]
+        return self.workers
 
+    def get_lane(self, url: str) -> Lane:
+        """Returns the lane of the host of an url, API calls being the default one"""
+        return self.lanes.get(urlparse(url).hostname, self.lanes[API_DEFAULT_HOST])
 
-            data = await self.queue.get()
+    async def worker(self, lane: Lane, worker_id=0):
+        print(f"Starting worker {worker_id} for {lane.host}...")
+        while True:
 
-            prio, req = data.priority, data.data
+            request = await lane.scheduler.get()
+
+            if request.future.done():
+                #Cancelled by its callers
+                continue
+
+            try:
+                await self.send(lane, request, worker_id)
+            except Exception as e:
+                #The worker keeps serving the lane whatever happens to one request
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Worker {worker_id} of {lane.host} failed on {request.key} : {e.__class__.__name__} {e}")
+                request.fail(f"unexpected {e.__class__.__name__}")
+            finally:
+                #New identical requests must hit the network again from now on
+                if self.requests.get(request.key) is request:
+                    del self.requests[request.key]
+
+    async def send(self, lane: Lane, request: Request, worker_id=0) -> None:
+        """Sends a request until it succeeds, runs out of retries or time, or every caller gave up"""
+        check = False
+        prio = request.priority
+        request.started = True
+
+        url, params, key, method = request.url, request.params, request.key, request.method
+
+        headers = self.reqHeaders
+        validator_key = self.request_key(method, url, params)
+        if request.conditional and (validator := self.validators.get(validator_key)):
+            headers = {**self.reqHeaders, **validator['headers']}
+
+        if method == 'GET':
+            method_http = self.session.get
+        elif method == 'HEAD':
+            method_http = self.session.head
+
+
+        attempts = 0
+        while not check:
+
+            if request.future.done():
+                #Every caller gave up
+                break
+            if request.remaining() <= 0:
+                request.fail("deadline exceeded")
+                break
+            if attempts > request.retries:
+                request.fail(f"no success after {attempts} attempts")
+                break
+
+            if attempts:
+                delay = backoff_delay(attempts, API_BACKOFF_BASE, API_BACKOFF_CAP)
+                await asyncio.sleep(min(delay, max(0, request.remaining())))
+            attempts += 1
+
+            try:
+                await asyncio.wait_for(lane.breaker.wait(), max(0, request.remaining()))
+            except asyncio.TimeoutError:
+                request.fail(f"{lane.host} unavailable")
+                break
+
+            await lane.bucket.acquire()
+            if DEBUG:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Worker {worker_id} treating item in queue : {key} -> {url} + {params} - (Priority {prio})")
+            try:
+                async with method_http(url, params=params, cookies=cookies_rootme, headers=headers, timeout=self.timeout) as r:
+                    self.stats['requests'] += 1
+
+                    if r.status == 429 or r.status >= 500:
+                        retry_after = parse_retry_after(r.headers.get('Retry-After'))
+                        lane.bucket.throttle(retry_after)
+                        self.stats['throttled'] += 1
+                        print(f"[{datetime.now().strftime('%H:%M:%S')}] Status : {r.status} - throttling to {lane.bucket}, retry after {retry_after:.0f}s")
+                        if retry_after >= API_BAN_THRESHOLD:
+                            self.banned(lane, retry_after)
+                        else:
+                            lane.breaker.failure()
+                        check = False
+                        continue
 
-            url, params, key, method = req
+                    # HEAD
+                    if method == 'HEAD':
+                        if r.status == 200:
+                            data = '200'
+                            check = True
+                        else:
+                            data = '404' if r.status == 404 else str(r.status)
+                            check = True
+                        lane.bucket.success()
+                        lane.breaker.success()
+                        continue
+
+                    # GET
+                    if r.status == 200:
+                        data = await r.text()
+                        if request.conditional:
+                            self.store_validators(validator_key, r.headers, r.content_length or len(data))
+                        check = True
+                    elif r.status == 304:
+                        data = 'NOT_MODIFIED'
+                        check = True
+                    elif r.status == 401:
+                        data = 'PREMIUM'
+                        check = True
+
+                    # search for non existent username are now 404..
+                    elif r.status == 404:
+                        data = '404'
+                        check = True
+                    elif r.status == 403:
+                        #Root-Me answers 403 to banned clients
+                        self.banned(lane, API_BAN_DURATION)
+                        check = False
+                    else:
+                        print(f'Status : {r.status} - restarting')
+                        lane.breaker.failure()
+                        check = False
+
+                    if check:
+                        lane.bucket.success()
+                        lane.breaker.success()
+
+            except (aiohttp.ClientError, TimeoutError) as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Got {e.__class__.__name__}, retrying...")
+                lane.breaker.failure()
+                check = False
+
+
+        if check and not request.future.done():
+            request.future.set_result(data)
+
+    def banned(self, lane: Lane, duration: float) -> None:
+        """Pauses every request to a host that banned us"""
+        self.ban = datetime.now() + timedelta(seconds=duration)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Banned by {lane.host} until {self.ban.strftime('%H:%M:%S')}")
+        lane.breaker.open(duration)
+
+    def available(self, url=api_base_url) -> bool:
+        """Whether requests to the host of url can currently be sent"""
+        return self.get_lane(url).breaker.available()
+
+    def store_validators(self, key: str, headers, size: int) -> None:
+        """Remembers the ETag/Last-Modified of a response until commit_validators is called for it"""
+        validator = {}
+        if etag := headers.get('ETag'):
+            validator['If-None-Match'] = etag
+        if last_modified := headers.get('Last-Modified'):
+            validator['If-Modified-Since'] = last_modified
+
+        if validator:
+            old = self.validators.get(key, {})
+            self.pending_validators[key] = {'headers': validator, 'size': size, 'parse_time': old.get('parse_time', 0.0)}
+        else:
+            self.pending_validators[key] = None
 
-            if method == 'GET':
-                method_http = self.session.get
-            elif method == 'HEAD':
-                method_http = self.session.head
+    def commit_validators(self, key: str) -> None:
+        """Sends the validators of the last response with the next conditional request, once it was applied"""
+        if key not in self.pending_validators:
+            return
 
+        if validator := self.pending_validators.pop(key):
+            self.validators[key] = validator
+        else:
+            self.validators.pop(key, None)
 
-            while not check:
+    def user_key(self, idx: int) -> str:
+        """Key of the validators of a user"""
+        return self.request_key('GET', f"{api_base_url}{auteurs_path}/{idx}", {})
 
+    def request_key(self, method: str, url: str, params: dict) -> str:
+        """Identifies identical requests, so they can share one network call"""
+        return f"{method} {url}?" + '&'.join(f"{k}={v}" for k, v in sorted(params.items()))
 
+    async def enqueue(self, method: str, url: str, params: dict, priority: int, conditional=False, timeout=None) -> str:
+        """Queues a request, or joins the identical one already queued or in flight, and waits at most timeout seconds"""
+        key = self.request_key(method, url, params)
+        if conditional:
+            key += ' conditional'
 
-                await asyncio.sleep(API_REQ_DELAY)
-                if DEBUG:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Treating item in queue : {key} -> {url} + {params} - (Priority {prio})")
-                try:
-                    async with method_http(url, params=params, cookies=cookies_rootme, headers=self.reqHeaders) as r:
+        if timeout is None:
+            timeout = API_DEADLINES.get(priority, max(API_DEADLINES.values()))
 
-                        # HEAD
-                        if method == 'HEAD':
-                            if r.status == 200:
-                                data = '200'
-                                check = True
-                            elif r.status == 404:
-                                data = '404'
-                                check = True
-                            continue
+        lane = self.get_lane(url)
 
-                        # GET
-                        if r.status == 200:
-                            data = await r.text()
-                            check = True
-                        elif r.status == 401:
-                            data = 'PREMIUM'
-                            check = True
+        if priority == 0 and not lane.breaker.available():
+            #Don't make interactive commands wait for the host to come back
+            if self.ban > datetime.now():
+                raise Banned(self.ban)
+            raise RequestFailed(url, f"{lane.host} unavailable, retrying later")
 
-                        # search for non existent username are now 404..
-                        elif r.status == 404:
-                            data = '404'
-                            check = True
-                        else:
-                            print(f'Status : {r.status} - restarting')
-                            await asyncio.sleep(15)
-                            check = False
+        if (request := self.requests.get(key)) and not request.future.done():
+            self.stats['coalesced'] += 1
+
+            if DEBUG:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Request for {url} joined in-flight request -> {key} (Priority {priority})")
 
-                except ClientOSError as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Got {e.__class__.__name__}, retrying in 15s...")
-                    await asyncio.sleep(15)
-                    check = False
-                except (ServerDisconnectedError, ClientPayloadError) as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Got {e.__class__.__name__}, retrying...")
-                    check = False
+            if priority < request.priority and not request.started:
+                #Someone more urgent is waiting, move it with the better priority
+                lane.scheduler.reprioritize(request, priority)
 
+            waiting = asyncio.shield(request.future)
+            owner = False
+        else:
+            if DEBUG:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Request for {url} added to queue -> {key} (Priority {priority})")
 
-            self.requests[key]['result'] = data
-            self.requests[key]['event'].set()
+            request = Request(key, method, url, params, priority, conditional)
+            self.requests[key] = request
 
-            self.queue.task_done()
+            async def submit():
+                await lane.scheduler.put(request)
+                return await asyncio.shield(request.future)
 
-    async def get(self, url, params, priority=1):
-        key = uuid.uuid4().hex
+            waiting = submit()
+            #Only this caller knows whether the request made it to the queue
+            owner = True
 
-        if DEBUG:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Request for {url} added to queue -> {key} (Priority {priority})")
+        request.waiters += 1
+        request.extend_deadline(timeout)
 
-        event = asyncio.Event()
-        self.requests[key] = {}
-        self.requests[key]['event'] = event
-        obj = PriorityEntry(priority, (url, params, key, 'GET'))
-        await self.queue.put(obj)
-        await event.wait()
         try:
-            result = json.loads(self.requests[key]['result'])
-        except JSONDecodeError:
-            if self.requests[key]['result'] == 'PREMIUM':
-                raise PremiumChallenge(0)
-            else:
-                print(f"Got invalid response > {self.requests[key]['result']}")
-                result = ''
+            return await asyncio.wait_for(waiting, timeout)
+        except asyncio.TimeoutError:
+            raise RequestFailed(url, f"no answer after {timeout}s")
+        finally:
+            request.waiters -= 1
+            if not request.future.done() and not request.started and ((request.queued and not request.waiters) or (owner and not request.queued)):
+                #Nobody is waiting anymore, or it could not be queued
+                lane.scheduler.remove(request)
+                if request.waiters:
+                    request.fail("could not be queued")
+                else:
+                    request.future.cancel()
+                if self.requests.get(key) is request:
+                    del self.requests[key]
+            elif not request.waiters and not request.future.done():
+                #Already being sent, the worker will stop retrying it, new identical requests don't join it
+                request.future.cancel()
+                if self.requests.get(key) is request:
+                    del self.requests[key]
+
+    async def get(self, url, params, priority=1, endpoint=None, conditional=False, refresh=False, timeout=None):
+        key = self.request_key('GET', url, params)
+        raw = None
+        if endpoint and not (conditional or refresh):
+            raw = await self.cache.get_unavailable(key, endpoint) or await self.cache.get(key, endpoint)
+
+        if raw is None:
+            raw = await self.enqueue('GET', url, params, priority, conditional, timeout)
+            if endpoint and raw in ('PREMIUM', '404'):
+                await self.cache.put_unavailable(key, endpoint, raw)
+            elif endpoint and not conditional and raw != 'NOT_MODIFIED':
+                #Conditional polls are answered by the validators, never by the cache
+                await self.cache.put(key, endpoint, raw)
+
+        if raw == 'PREMIUM':
+            raise PremiumChallenge(0)
+        elif raw == 'NOT_MODIFIED':
+            validator = self.validators.get(key, {})
+            self.stats['not_modified'] += 1
+            self.stats['bytes_saved'] += validator.get('size', 0)
+            self.stats['parse_time_saved'] += validator.get('parse_time', 0.0)
+            raise NotModified(url)
 
-        del self.requests[key]
+        try:
+            start = time.perf_counter()
+            result = await self.decoder.decode(raw)
+            if validator := self.pending_validators.get(key):
+                validator['parse_time'] = time.perf_counter() - start
+        except ValueError:
+            print(f"Got invalid response > {raw}")
+            result = ''
 
         return result
 
 
-    async def head(self, url, priority=1):
-        key = uuid.uuid4().hex
-
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Request for {url} added to queue -> {key} (Priority {priority})")
-
-        event = asyncio.Event()
-        self.requests[key] = {}
-        self.requests[key]['event'] = event
-        obj = PriorityEntry(priority, (url, {}, key, 'HEAD'))
-        await self.queue.put(obj)
-        await event.wait()
+    async def head(self, url, priority=1, timeout=None):
+        return await self.enqueue('HEAD', url, {}, priority, timeout=timeout)
 
-        result = self.requests[key]['result']
-        del self.requests[key]
-
-        return result
 
 
 
-
-    async def get_user_by_id(self, idx: int, priority=1) -> Auteur:
-        """Retreives an Auteur by id"""
+    async def get_user_by_id(self, idx: int, priority=1, conditional=False, watermark=None) -> Auteur:
+        """Retreives an Auteur by id, raises NotModified if conditional and unchanged since the last call.
+        With a watermark, only the validations made since then are extracted"""
 
         params = {
             #str(int(time.time())): str(int(time.time())),
             }
 
+        url = f"{api_base_url}{auteurs_path}/{idx}"
+        user_data = await self.get(url, params, priority, endpoint='auteur', conditional=conditional)
+
+        start = time.perf_counter()
+        aut = extract_auteur(user_data, watermark)
+        if validator := self.pending_validators.get(self.request_key('GET', url, params)):
+            validator['parse_time'] += time.perf_counter() - start
 
-        user_data = await self.get(f"{api_base_url}{auteurs_path}/{idx}", params, priority)
-        aut = extract_auteur(user_data)
         return aut
 
     async def search_user_by_name(self, username: str, start: int, priority=1) -> Auteurs:
@@ -205,63 +437,99 @@ class ApiRootMe():
         return current_users
 
 
-    async def fetch_all_challenges(self, start=0) -> list[ChallengeShort]:
-        """Retrieves all challenges given a starting number"""
-
-        params = {
-            #str(int(time.time())): str(int(time.time())),
-            'debut_challenges': str(start),
-            'lang': DEFAULT_LANG
-            }
+    async def iter_challenges(self, start=0, prefetch=CHALLENGES_PREFETCH, priority=1):
+        """Yields (offset, challenges) for each listing page, while the next pages are already requested"""
 
-        current_challenges = []
+        def page_params(offset: int) -> dict:
+            return {
+                #str(int(time.time())): str(int(time.time())),
+                'debut_challenges': str(offset),
+                'lang': DEFAULT_LANG
+                }
 
         if not start:
             print("Fetching all challenges...")
 
-        challenges_data = await self.get(f"{api_base_url}{challenges_path}/", params)
+        pending = {}
+        offset = next_offset = start
+        #Runs starting from the high-water mark usually read one page, only prefetch once a full one was read
+        ahead = 0 if start else prefetch
 
+        try:
+            while True:
+                #Keep the current page and `ahead` pages after it in the queue
+                while len(pending) <= ahead:
+                    pending[next_offset] = asyncio.create_task(self.get(f"{api_base_url}{challenges_path}/", page_params(next_offset), priority))
+                    next_offset += CHALLENGES_PAGE_SIZE - (next_offset % CHALLENGES_PAGE_SIZE)
 
-        #print(challenges_data)
+                challenges_data = await pending.pop(offset)
+                if not challenges_data or challenges_data == 404:
+                    return
 
-        current_challenges += extract_page_challenges(challenges_data)
+                page = extract_page_challenges(challenges_data)
+                yield offset, page
 
-        if challenges_data[-1]['rel'] == 'next':
-            return current_challenges + await self.fetch_all_challenges(start=start + (50 - (start % 50)))
-        else:
-            return current_challenges
+                if challenges_data[-1]['rel'] != 'next' or len(page) < CHALLENGES_PAGE_SIZE:
+                    #Last page, the prefetched ones are cancelled
+                    return
+
+                ahead = prefetch
+
+                offset += CHALLENGES_PAGE_SIZE - (offset % CHALLENGES_PAGE_SIZE)
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    async def fetch_all_challenges(self, start=0) -> list[ChallengeShort]:
+        """Retrieves all challenges given a starting number"""
+
+        current_challenges = []
+        async for _, page in self.iter_challenges(start):
+            current_challenges += page
 
         return current_challenges
 
 
-    async def get_challenge_by_id(self, idx: int, priority: int) -> Challenge:
-        """Retreives all information about a challenge by ID"""
+    async def get_challenge_by_id(self, idx: int, priority: int, refresh=False) -> Challenge:
+        """Retreives all information about a challenge by ID, bypassing the cache if refresh"""
 
         params = {
             #str(int(time.time())): str(int(time.time())),
             'lang': DEFAULT_LANG
             }
 
-        challenge_data = await self.get(f"{api_base_url}{challenges_path}/{idx}", params, priority)
+        challenge_data = await self.get(f"{api_base_url}{challenges_path}/{idx}", params, priority, endpoint='challenge', refresh=refresh)
         challenge = extract_challenge(challenge_data, idx)
         if challenge == None:
             print('ERROR',challenge_data)
             
         return challenge
 
-    async def get_image_png(self, idx: int) -> str:
+    async def get_avatar(self, idx: int) -> str:
+        """Returns the url of the avatar of a user, or None if they have none"""
 
-        url = f'https://www.root-me.org/IMG/auton{idx}.png'
-
-        code = await self.head(url, priority=0)
-
-        if code == '200':
+        key = f"avatar {idx}"
+        if await self.cache.get_unavailable(key, 'avatar'):
+            return None
+        if url := await self.cache.get(key, 'avatar'):
             return url
 
-    async def get_image_jpg(self, idx: int) -> str:
-
-        url = f'https://www.root-me.org/IMG/auton{idx}.jpg'
-        code = await self.head(url, priority=0)
-
-        if code == '200':
-            return url
+        codes = []
+        try:
+            for extension in ('png', 'jpg'):
+                url = f'https://www.root-me.org/IMG/auton{idx}.{extension}'
+                code = await self.head(url, priority=0)
+                if code == '200':
+                    await self.cache.put(key, 'avatar', url)
+                    return url
+                codes.append(code)
+        except (RequestFailed, Banned) as e:
+            #Only cosmetic, the default avatar is shown and nothing is remembered
+            print(f"Could not retreive the avatar of {idx} : {e}")
+            return None
+
+        #A 403 or a redirect says nothing about the avatar
+        if all(code == '404' for code in codes):
+            await self.cache.put_unavailable(key, 'avatar', '404')
+
+        return None
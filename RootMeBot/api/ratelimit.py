@@ -0,0 +1,84 @@
+"""Module for the API rate limiter"""
+import asyncio
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value: str) -> float:
+    """Converts a Retry-After header (seconds or HTTP date) to a delay in seconds"""
+    if not value:
+        return 0.0
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+    return max(0.0, date.timestamp() - datetime.now().timestamp())
+
+
+class TokenBucket():
+    """Token bucket shared by all the API workers, adapting its rate to the server answers"""
+
+    def __init__(self, rate: float, burst: int, min_rate: float, recover_after: int) -> None:
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.burst = burst
+        self.recover_after = recover_after
+
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+        self.successes = 0
+
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Adds the tokens earned since the last refill"""
+        now = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    async def acquire(self) -> None:
+        """Waits until a request can be sent"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def success(self) -> None:
+        """Loosens the rate after a run of successful requests"""
+        self.successes += 1
+        if self.successes >= self.recover_after and self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate * 1.5)
+            self.successes = 0
+
+    def throttle(self, retry_after: float = 0.0) -> None:
+        """Tightens the rate after a 429/5xx, and blocks for Retry-After seconds if given"""
+        self._refill()
+        self.successes = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def __str__(self) -> str:
+        return f"TokenBucket {self.rate:.2f} req/s (burst {self.burst})"
@@ -0,0 +1,99 @@
+"""Module for the API request scheduler"""
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from classes.error import RequestFailed
+
+
+class RequestScheduler():
+    """Queue of requests, FIFO inside a priority class, with aging between classes and a depth limit per class"""
+
+    def __init__(self, limits: dict[int, int], aging: float, shed_priority: int) -> None:
+        self.limits = limits
+        self.aging = aging
+        self.shed_priority = shed_priority
+
+        self.queues = {priority: deque() for priority in limits}
+        self.counter = itertools.count()
+        self.changed = asyncio.Condition()
+
+        self.stats = {priority: {'queued': 0, 'served': 0, 'wait': 0.0, 'max_wait': 0.0, 'deferred': 0, 'shed': 0} for priority in limits}
+
+    def get_class(self, priority: int) -> int:
+        """Priorities outside of the configured classes go to the closest one"""
+        return min(max(priority, min(self.queues)), max(self.queues))
+
+    def qsize(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def put(self, request) -> None:
+        """Queues a request, waits for room if its class is full, or sheds it if it is low-value work"""
+        priority = self.get_class(request.priority)
+
+        async with self.changed:
+            if len(self.queues[priority]) >= self.limits[priority]:
+                if priority >= self.shed_priority:
+                    self.stats[priority]['shed'] += 1
+                    raise RequestFailed(request.url, "too many queued requests, shed")
+
+                self.stats[priority]['deferred'] += 1
+                await self.changed.wait_for(lambda: len(self.queues[priority]) < self.limits[priority])
+
+            self.queues[priority].append((next(self.counter), time.monotonic(), request))
+            self.stats[priority]['queued'] += 1
+            request.queued = True
+            self.changed.notify_all()
+
+    async def get(self):
+        """Returns the request with the best priority once aged, the oldest one on ties"""
+        async with self.changed:
+            await self.changed.wait_for(self.qsize)
+
+            now = time.monotonic()
+            heads = [(priority - (now - queue[0][1]) / self.aging, queue[0][0], priority) for priority, queue in self.queues.items() if queue]
+            _, _, priority = min(heads)
+
+            _, queued_at, request = self.queues[priority].popleft()
+            request.queued = False
+
+            wait = now - queued_at
+            stats = self.stats[priority]
+            stats['served'] += 1
+            stats['wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+
+            self.changed.notify_all()
+
+        return request
+
+    def remove(self, request) -> bool:
+        """Removes a request that nobody waits for anymore"""
+        for queue in self.queues.values():
+            for item in queue:
+                if item[2] is request:
+                    queue.remove(item)
+                    request.queued = False
+                    asyncio.create_task(self.notify())
+                    return True
+        return False
+
+    def reprioritize(self, request, priority: int) -> None:
+        """Moves a queued request to a better class, keeping the time it already waited"""
+        old, new = self.get_class(request.priority), self.get_class(priority)
+        request.priority = priority
+        if old == new:
+            return
+
+        for item in self.queues[old]:
+            if item[2] is request:
+                self.queues[old].remove(item)
+                #Keep the class ordered by arrival
+                position = next((i for i, other in enumerate(self.queues[new]) if other[0] > item[0]), len(self.queues[new]))
+                self.queues[new].insert(position, item)
+                return
+
+    async def notify(self) -> None:
+        async with self.changed:
+            self.changed.notify_all()
@@ -0,0 +1,38 @@
+"""Module for the event loop lag monitor"""
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+
+
+class LoopLagMonitor():
+    """Measures how late the event loop wakes up a sleeping task, blocking calls show up as lag"""
+
+    def __init__(self, interval: float, threshold: float, window: int = 600) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Event loop blocked for {lag * 1000:.0f} ms")
+
+    def stats(self) -> dict[str, float]:
+        """Average, 99th percentile and max lag, in seconds, over the last samples"""
+        if not self.samples:
+            return {'average': 0.0, 'p99': 0.0, 'max': self.max_lag}
+
+        ordered = sorted(self.samples)
+        return {
+            'average': sum(ordered) / len(ordered),
+            'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            'max': self.max_lag
+            }
@@ -1,10 +1,12 @@
 """Module for the discord bot"""
 import asyncio
+import traceback
 
 import discord
 import utils.messages as utils
 from classes.error import *
-from constants import BOT_PREFIX, UPDATE_CHALL_DELAY, UPDATE_USERS_DELAY
+from bot.lag import LoopLagMonitor
+from constants import BOT_PREFIX, DB_MAINTENANCE_DELAY, LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD, UPDATE_CHALL_DELAY, UPDATE_USERS_DELAY
 from database.manager import DatabaseManager
 from discord import Embed
 from discord.ext import commands
@@ -27,6 +29,7 @@ class RootMeBot():
 
         self.notification_manager = notification_manager
         self.database_manager = database_manager
+        self.lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD)
 
         self.init_done = False
 
@@ -78,9 +81,9 @@ class RootMeBot():
 
         while True:
             try:
-                for aut, chall, score_above, is_blood in self.notification_manager.get_solve_queue():
+                for aut, chall, date, score_above, is_blood in self.notification_manager.get_solve_queue():
                     if chall:
-                        await utils.send_new_solve(channel, chall, aut, score_above, is_blood)
+                        await utils.send_new_solve(channel, chall, aut, date, score_above, is_blood)
 
 
                 for chall in self.notification_manager.get_chall_queue():
@@ -127,6 +130,17 @@ class RootMeBot():
                 await utils.panic_message(channel, e, "solves worker")
             await asyncio.sleep(UPDATE_USERS_DELAY)
 
+    async def cron_db_maintenance(self) -> None:
+        """Runs the periodic database maintenance"""
+
+        while True:
+            await asyncio.sleep(DB_MAINTENANCE_DELAY)
+            try:
+                await self.database_manager.maintain()
+            except Exception as e:
+                channel = self.bot.get_channel(self.BOT_CHANNEL)
+                await utils.panic_message(channel, e, "database maintenance")
+
     def catch(self):
         """Catch discord event"""
         @self.bot.event
@@ -134,6 +148,16 @@ class RootMeBot():
                     for server in self.bot.guilds:
                         print(f'RootMeBot is starting on the following server: "{server.name}" !')
 
+        @self.bot.event
+        async def on_command_error(context: Context, error: commands.CommandError):
+            original = getattr(error, 'original', error)
+            if isinstance(original, RequestFailed):
+                await utils.request_failed(context.message.channel, original)
+            elif isinstance(original, Banned):
+                await utils.banned(context.message.channel, original.time)
+            else:
+                traceback.print_exception(type(error), error, error.__traceback__)
+
 
         @self.bot.command(description='Remove user by ID', pass_context=True)
         @commands.check(self.after_init)
@@ -397,10 +421,7 @@ class RootMeBot():
                     auteur = auteurs[0]
 
 
-            image_profile = await self.database_manager.rootme_api.get_image_png(auteur.idx)
-
-            if not image_profile:
-                image_profile = await self.database_manager.rootme_api.get_image_jpg(auteur.idx)
+            image_profile = await self.database_manager.rootme_api.get_avatar(auteur.idx)
             if not image_profile:
                 image_profile = 'https://www.root-me.org/IMG/auton0.png'
 
@@ -412,6 +433,46 @@ class RootMeBot():
 
 
 
+        @self.bot.command(description='Shows the API cache stats, or clears it')
+        @commands.check(self.after_init)
+        @self.check_channel()
+        async def cache(context: Context) -> None:
+            """[clear [challenge or auteur]]"""
+            args = self.get_command_args(context)
+            api_cache = self.database_manager.rootme_api.cache
+
+            if len(args) < 1:
+                await utils.cache_stats(context.message.channel, api_cache.stats, await api_cache.sizes())
+                return
+
+            endpoint = args[1] if len(args) > 1 else None
+            if args[0] != 'clear' or (endpoint and endpoint not in api_cache.policies):
+                await utils.usage(context.message.channel)
+                return
+
+            removed = await api_cache.invalidate(endpoint)
+            await utils.cache_cleared(context.message.channel, endpoint, removed)
+
+
+
+        @self.bot.command(description='Shows the API request queues')
+        @commands.check(self.after_init)
+        @self.check_channel()
+        async def queue(context: Context) -> None:
+            """ """
+            await utils.queue_stats(context.message.channel, self.database_manager.rootme_api.lanes.values())
+
+
+
+        @self.bot.command(description='Shows how long database transactions are held, and the event loop lag')
+        @commands.check(self.after_init)
+        @self.check_channel()
+        async def db(context: Context) -> None:
+            """ """
+            await utils.db_stats(context.message.channel, self.database_manager.transaction_stats, self.lag_monitor.stats())
+
+
+
         @self.bot.command(description='Shows the view to manage a user')
         @commands.check(self.after_init)
         @self.check_channel()
@@ -469,7 +530,7 @@ class RootMeBot():
                 chall = await self.database_manager.get_challenge_from_db(search_id)
 
                 if chall:
-                    await utils.who_solved(context.message.channel, chall, self.database_manager.session_maker)
+                    await utils.who_solved(context.message.channel, chall, self.database_manager)
                 else:
                     await utils.cant_find_challenge(context.message.channel, search)
 
@@ -480,11 +541,11 @@ class RootMeBot():
                     await utils.many_challenges(context.message.channel, results)
 
                 elif len(results) > 1:
-                    await utils.multiple_challenges(context.message.channel, results, self.database_manager.session_maker)
+                    await utils.multiple_challenges(context.message.channel, results, self.database_manager)
 
                 elif len(results) == 1:
                     chall = results[0]
-                    await utils.who_solved(context.message.channel, chall, self.database_manager.session_maker)
+                    await utils.who_solved(context.message.channel, chall, self.database_manager)
 
                 else:
                     await utils.cant_find_challenge(context.message.channel, search)
@@ -502,11 +563,13 @@ class RootMeBot():
 
             self.bot.loop.create_task(self.init_db())
 
-            self.worker = self.bot.loop.create_task(self.database_manager.rootme_api.worker())
+            self.workers = self.database_manager.rootme_api.start_workers()
+            self.bot.loop.create_task(self.lag_monitor.run())
             self.check_solves = self.bot.loop.create_task(self.cron_check_solves())
             self.check_challs = self.bot.loop.create_task(self.cron_check_challs())
 
             self.bot.loop.create_task(self.cron_display())
+            self.bot.loop.create_task(self.cron_db_maintenance())
 
             
             await self.bot.start(TOKEN)
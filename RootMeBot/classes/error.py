@@ -22,8 +22,25 @@ class UnknownUser(Exception):
 
 
 class Banned(Exception):
-	"""Exception raised when banned"""
+	"""Exception raised when banned, time being the end of the ban"""
 	def __init__(self, time) -> None:
 		self.time = time
 	def __str__(self) -> str:
-		return f"Banned at : {self.time}"
+		return f"Banned until : {self.time}"
+
+
+class NotModified(Exception):
+	"""Exception raised when a conditional request returns 304"""
+	def __init__(self, url) -> None:
+		self.url = url
+	def __str__(self) -> str:
+		return f"Not modified : {self.url}"
+
+
+class RequestFailed(Exception):
+	"""Exception raised when a request misses its deadline or runs out of retries"""
+	def __init__(self, url, reason) -> None:
+		self.url = url
+		self.reason = reason
+	def __str__(self) -> str:
+		return f"Request to {self.url} failed : {self.reason}"
@@ -109,9 +109,9 @@ class MultipleChallButton(discord.ui.Select):
         await self.view.show_challenge(self.values[0])
 
 class MultipleChallFoundView(discord.ui.View):
-    def __init__(self, channel: TextChannel, challenges: list[Challenge], Session):
+    def __init__(self, channel: TextChannel, challenges: list[Challenge], db_manager: DatabaseManager):
         super().__init__()
-        self.Session = Session
+        self.database_manager = db_manager
         self.channel = channel
         self.challenges = challenges
 
@@ -119,7 +119,7 @@ class MultipleChallFoundView(discord.ui.View):
 
     async def show_challenge(self, idx: str):
         chall = next(filter(lambda x: x.idx == int(idx), self.challenges))
-        await utils.who_solved(self.channel, chall, self.Session)
+        await utils.who_solved(self.channel, chall, self.database_manager)
 
 class MultipleUserButton(discord.ui.Select):
     def __init__(self, users: list[Auteur]):
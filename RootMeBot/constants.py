@@ -15,10 +15,56 @@ auteurs_path = "auteurs"
 
 DEFAULT_LANG = "fr"
 
+### API DECODING ###
+
+# payloads at least this long are decoded out of the event loop
+JSON_OFFLOAD_THRESHOLD = 256 * 1024
+JSON_WORKERS = 2
+
+### API PAGINATION ###
+
+CHALLENGES_PAGE_SIZE = 50
+CHALLENGES_PREFETCH = 2
+
 ### DATABASE ####
 
 database_path = "/opt/db/rootme.db"
 LOG_PATH = "/opt/db/log.txt"
+# Transactions held longer than this (in seconds) are logged
+DB_SLOW_TRANSACTION = 0.5
+# Threads running read queries, writes go through a single thread
+DB_READERS = 4
+# Set on every connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 15000,
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+# PRAGMA optimize and WAL checkpoint
+DB_MAINTENANCE_DELAY = 3600
+# Event loop lag sampling interval and logging threshold, in seconds
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_THRESHOLD = 0.1
+
+### API CACHE ###
+
+CACHE_PATH = "/opt/db/cache.db"
+# endpoint -> (ttl in seconds, max entries)
+CACHE_POLICIES = {
+    'challenge': (7 * 24 * 3600, 2000),
+    'auteur': (15, 1000),
+    'avatar': (24 * 3600, 5000),
+}
+# endpoint -> seconds before rechecking a premium (401) or missing (404) resource
+NEGATIVE_CACHE_POLICIES = {
+    'challenge': 24 * 3600,
+    'avatar': 6 * 3600,
+}
+# seconds between two writes of the last access of an entry, for the LRU eviction
+CACHE_ACCESS_RESOLUTION = 60
 
 ### BOT CONSTANTS ###
 
@@ -27,8 +73,53 @@ BOT_PREFIX = "!"
 PING_DEV = getenv("PING_DEV")
 
 ### DELAYS ###
-API_REQ_DELAY = 0.5
 UPDATE_USERS_DELAY = 30
 UPDATE_CHALL_DELAY = 3600
 
+### CHALLENGES SYNC ###
+# A full listing scan every N incremental runs
+CHALLENGE_FULL_SCAN_RUNS = 24
+# Known challenges re-fetched each run to pick up score/difficulty edits
+CHALLENGE_REFRESH_SLICE = 25
+
+### RATE LIMIT ###
+# host -> (workers, rate in req/s, burst)
+API_LANES = {
+    'api.www.root-me.org': (4, 4, 4),
+    'www.root-me.org': (2, 2, 2),
+}
+API_DEFAULT_HOST = 'api.www.root-me.org'
+
+### REQUESTS ###
+# priority -> seconds a caller waits before giving up
+API_DEADLINES = {
+    0: 30,
+    1: 300,
+    2: 600,
+}
+API_MAX_RETRIES = 5
+API_BACKOFF_BASE = 1
+API_BACKOFF_CAP = 60
+# priority class -> max queued requests per lane
+API_QUEUE_LIMITS = {
+    0: 100,
+    1: 1000,
+    2: 50,
+}
+# seconds of waiting that make a request worth one priority level
+API_QUEUE_AGING = 30
+# classes from which requests are shed instead of deferred when full
+API_SHED_PRIORITY = 2
+
+### CIRCUIT BREAKER ###
+# consecutive failures before a host is paused
+API_BREAKER_THRESHOLD = 5
+API_BREAKER_COOLDOWN = 30
+API_BREAKER_MAX_COOLDOWN = 900
+# a Retry-After at least this long is treated as a ban
+API_BAN_THRESHOLD = 120
+API_BAN_DURATION = 900
+API_RATE_MIN = 0.5
+API_RATE_RECOVER = 20
+
 DEBUG=False
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""Module for the PollBatch"""
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.dialects.sqlite import insert
+
+from database.models.auteur_model import Auteur
+from database.models.auteur_state_model import AuteurState
+from database.models.category_stats_model import AuteurCategoryStats
+from database.models.challenge_model import Challenge
+from database.models.challenge_solvers_model import ChallengeSolvers
+from database.models.daily_score_model import DailyScore
+from database.models.validation_model import Validation, epoch_day
+
+#Stays under the SQLite bound parameters limit
+CHUNK_SIZE = 500
+
+
+class PollBatch():
+    """Collects everything a poll cycle has to write, so that it is written at once with set-based statements"""
+
+    def __init__(self) -> None:
+        self.auteurs = {}
+        self.states = {}
+        self.challenges = {}
+        self.validations = {}
+        #Users whose update was written, the ones removed meanwhile are left out
+        self.written = []
+
+    def add_auteur(self, auteur: Auteur, complete: bool) -> None:
+        """Adds the score and rank update of a user, with the state of its payload if all of it is applied"""
+        self.auteurs[auteur.idx] = {'b_idx': auteur.idx, 'b_username': auteur.username, 'b_score': auteur.score, 'b_rank': auteur.rank}
+        if not complete:
+            return
+
+        self.states[auteur.idx] = {
+            'auteur_id': auteur.idx,
+            'last_validation': auteur.watermark[0],
+            'validation_count': auteur.watermark[1],
+            'fingerprint': auteur.fingerprint
+            }
+
+    def add_challenge(self, challenge: Challenge) -> None:
+        self.challenges[challenge.idx] = {key: getattr(challenge, key) for key in challenge.keys()}
+
+    def add_validation(self, idx: str, auteur_id: int, challenge_id: int, date: datetime) -> None:
+        self.validations[idx] = {'idx': idx, 'auteur_id': auteur_id, 'challenge_id': challenge_id, 'date': date, 'day': epoch_day(date)}
+
+    def __len__(self) -> int:
+        return len(self.auteurs) + len(self.challenges) + len(self.validations)
+
+    def write(self, session) -> list[dict]:
+        """Writes the batch in the session, and returns the validations that were not in database yet"""
+
+        #Users removed during the poll cycle are left out
+        ids = list(self.auteurs)
+        existing_auteurs = set()
+        for i in range(0, len(ids), CHUNK_SIZE):
+            existing_auteurs.update(idx for idx, in session.query(Auteur.idx).filter(Auteur.idx.in_(ids[i:i + CHUNK_SIZE])))
+
+        keys = [key for key, val in self.validations.items() if val['auteur_id'] in existing_auteurs]
+        existing_validations = set()
+        for i in range(0, len(keys), CHUNK_SIZE):
+            existing_validations.update(idx for idx, in session.query(Validation.idx).filter(Validation.idx.in_(keys[i:i + CHUNK_SIZE])))
+        new_validations = [self.validations[key] for key in keys if key not in existing_validations]
+
+        if self.challenges:
+            session.execute(insert(Challenge.__table__).on_conflict_do_nothing(), list(self.challenges.values()))
+
+        self.written = list(existing_auteurs)
+        auteurs = [self.auteurs[idx] for idx in existing_auteurs]
+        if auteurs:
+            table = Auteur.__table__
+            session.execute(
+                table.update().where(table.c.idx == bindparam('b_idx')).values(
+                    username=bindparam('b_username'), score=bindparam('b_score'), rank=bindparam('b_rank')
+                    ),
+                auteurs
+                )
+
+        states = [self.states[idx] for idx in existing_auteurs if idx in self.states]
+        if states:
+            stmt = insert(AuteurState.__table__)
+            session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=['auteur_id'],
+                    set_={key: stmt.excluded[key] for key in ('last_validation', 'validation_count', 'fingerprint')}
+                    ),
+                states
+                )
+
+        if new_validations:
+            session.execute(insert(Validation.__table__).on_conflict_do_nothing(), new_validations)
+            challenges = self.challenge_scores(session, new_validations)
+            self.add_category_stats(session, new_validations, challenges)
+            self.add_daily_scores(session, new_validations, challenges)
+            self.add_challenge_solvers(session, new_validations)
+
+        return new_validations
+
+    @staticmethod
+    def add_challenge_solvers(session, new_validations: list[dict]) -> None:
+        """Counts the new validations in the solvers of their challenges, and sets their 'position' among them"""
+
+        by_challenge = {}
+        for val in sorted(new_validations, key=lambda val: val['date']):
+            by_challenge.setdefault(val['challenge_id'], []).append(val)
+
+        chall_ids = list(by_challenge)
+        counts = {}
+        for i in range(0, len(chall_ids), CHUNK_SIZE):
+            counts.update(session.query(ChallengeSolvers.challenge_id, ChallengeSolvers.solvers).filter(ChallengeSolvers.challenge_id.in_(chall_ids[i:i + CHUNK_SIZE])))
+
+        for chall_idx, vals in by_challenge.items():
+            for position, val in enumerate(vals, counts.get(chall_idx, 0) + 1):
+                val['position'] = position
+
+        table = ChallengeSolvers.__table__
+        stmt = insert(table)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['challenge_id'],
+                set_={
+                    'solvers': table.c.solvers + stmt.excluded.solvers,
+                    'first_solve': func.min(func.coalesce(table.c.first_solve, stmt.excluded.first_solve), stmt.excluded.first_solve)
+                    }
+                ),
+            [{'challenge_id': chall_idx, 'solvers': len(vals), 'first_solve': vals[0]['date']} for chall_idx, vals in by_challenge.items()]
+            )
+
+    @staticmethod
+    def challenge_scores(session, new_validations: list[dict]) -> dict[int, tuple[str, int]]:
+        """Returns the (category, score) of the challenges of the validations"""
+
+        chall_ids = list({val['challenge_id'] for val in new_validations})
+        challenges = {}
+        for i in range(0, len(chall_ids), CHUNK_SIZE):
+            challenges.update((idx, (category, score)) for idx, category, score in session.query(Challenge.idx, Challenge.category, Challenge.score).filter(Challenge.idx.in_(chall_ids[i:i + CHUNK_SIZE])))
+        return challenges
+
+    @staticmethod
+    def add_daily_scores(session, new_validations: list[dict], challenges: dict[int, tuple[str, int]]) -> None:
+        """Adds the new validations to the daily rollup of their users"""
+
+        solves, points = Counter(), Counter()
+        for val in new_validations:
+            if val['challenge_id'] not in challenges:
+                continue
+            _, score = challenges[val['challenge_id']]
+            solves[val['day'], val['auteur_id']] += 1
+            points[val['day'], val['auteur_id']] += score or 0
+
+        if not solves:
+            return
+
+        table = DailyScore.__table__
+        stmt = insert(table)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['day', 'auteur_id'],
+                set_={'points': table.c.points + stmt.excluded.points, 'solves': table.c.solves + stmt.excluded.solves}
+                ),
+            [{'day': day, 'auteur_id': auteur_id, 'points': points[day, auteur_id], 'solves': count} for (day, auteur_id), count in solves.items()]
+            )
+
+    @staticmethod
+    def add_category_stats(session, new_validations: list[dict], challenges: dict[int, tuple[str, int]]) -> None:
+        """Adds the new validations to the per category stats of their users"""
+
+        solves, points = Counter(), Counter()
+        for val in new_validations:
+            category, score = challenges.get(val['challenge_id'], (None, 0))
+            if category is None:
+                continue
+            solves[val['auteur_id'], category] += 1
+            points[val['auteur_id'], category] += score or 0
+
+        if not solves:
+            return
+
+        table = AuteurCategoryStats.__table__
+        stmt = insert(table)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['auteur_id', 'category'],
+                set_={'solves': table.c.solves + stmt.excluded.solves, 'points': table.c.points + stmt.excluded.points}
+                ),
+            [{'auteur_id': auteur_id, 'category': category, 'solves': count, 'points': points[auteur_id, category]} for (auteur_id, category), count in solves.items()]
+            )
@@ -0,0 +1,43 @@
+"""Module for the CatalogStats cache"""
+from collections import Counter
+
+
+class CatalogStats():
+    """Statistics of the challenges catalog, computed again only once the catalog version changed"""
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.cached_version = -1
+        self.cached = None
+        self.stats = {'hits': 0, 'computes': 0}
+
+    def bump(self) -> None:
+        """To call whenever a challenge is inserted or changed"""
+        self.version += 1
+
+    def get(self) -> dict:
+        """Returns the statistics, or None if they have to be computed again"""
+        if self.cached_version != self.version:
+            return None
+
+        self.stats['hits'] += 1
+        return self.cached
+
+    def store(self, version: int, rows: list[tuple[str, str, int, int]]) -> dict:
+        """Builds the statistics from (category, difficulty, count, points) rows read at the given version"""
+        challenges, points, difficulties = Counter(), Counter(), {}
+        for category, difficulty, count, total in rows:
+            challenges[category] += count
+            points[category] += total
+            difficulties.setdefault(category, Counter())[difficulty] += count
+
+        stats = {
+            'challenges': dict(challenges),
+            'points': dict(points),
+            'difficulties': {category: dict(counts) for category, counts in difficulties.items()}
+            }
+
+        self.stats['computes'] += 1
+        #Kept even if the catalog changed meanwhile, the version makes the next call compute them again
+        self.cached, self.cached_version = stats, version
+        return stats
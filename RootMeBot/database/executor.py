@@ -0,0 +1,23 @@
+"""Module for the DatabaseExecutor"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class DatabaseExecutor():
+    """Runs blocking database calls in threads, writes one at a time and reads in parallel"""
+
+    def __init__(self, readers: int) -> None:
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+
+    async def read(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.readers, partial(func, *args, **kwargs))
+
+    async def write(self, func, *args, **kwargs):
+        """SQLite only allows one writer, queueing them here avoids waiting on the database lock"""
+        return await asyncio.get_running_loop().run_in_executor(self.writer, partial(func, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self.writer.shutdown(wait=True)
+        self.readers.shutdown(wait=True)
@@ -1,22 +1,36 @@
 """Module for the DatabaseManager"""
 import asyncio
 import code
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 
 from api.fetch import ApiRootMe
 from classes.auteur import AuteurData
 from classes.challenge import ChallengeData
-from classes.enums import Stats
-from classes.error import PremiumChallenge, UnknownUser
-from constants import database_path
+from classes.error import NotModified, PremiumChallenge, RequestFailed, UnknownUser
+from constants import CHALLENGE_FULL_SCAN_RUNS, CHALLENGE_REFRESH_SLICE, DB_READERS, DB_SLOW_TRANSACTION, SQLITE_PRAGMAS, database_path
 from notify.manager import NotificationManager
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import make_transient, sessionmaker
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import text
 
+from database.batch import PollBatch
+from database.catalog import CatalogStats
+from database.score_index import ScoreIndex
+from database.executor import DatabaseExecutor
+from database.migrations import migrate
 from database.models.auteur_model import Auteur
+from database.models.auteur_state_model import AuteurState
 from database.models.base_model import Base
+from database.models.category_stats_model import AuteurCategoryStats, rebuild_category_stats
 from database.models.challenge_model import Challenge
-from database.models.scoreboard_model import Scoreboard
+from database.models.challenge_solvers_model import ChallengeSolvers, rebuild_challenge_solvers
+from database.models.daily_score_model import DailyScore, rebuild_daily_scores
+from database.models.scoreboard_model import Scoreboard, association_table
+from database.models.sync_model import SyncState
+from database.models.validation_model import Validation, epoch_day
 
 Solves = list[tuple[AuteurData, ChallengeData]]
 Challenges = list[ChallengeData]
@@ -30,18 +44,123 @@ class DatabaseManager():
         self.rootme_api = rootme_api
         self.notification_manager = notification_manager
 
-        self.engine = create_engine(f"sqlite://{database_path}", connect_args={'timeout': 15}, pool_size=100, max_overflow=50)
+        #Connections are used from the executor threads, one thread at a time, plus the event loop for the few synchronous calls
+        self.engine = create_engine(f"sqlite://{database_path}", connect_args={'check_same_thread': False}, pool_size=DB_READERS + 2, max_overflow=0)
+        event.listen(self.engine, 'connect', self.set_pragmas)
         Base.metadata.create_all(bind=self.engine)
+        print(f"Database schema version {migrate(self.engine)}")
+        self.check_profile()
 
         self.session_maker = sessionmaker(self.engine, expire_on_commit=False)
 
-    def count_challenges(self) -> int:
-        """Counts number of challenges, used for initialization"""
+        #Ids of the challenges in database, updated on every insert so that updates never scan the table
+        with self.session_maker.begin() as session: # type: ignore
+            self.challenge_ids = {idx for idx, in session.query(Challenge.idx).all()}
 
+        #Scores of all users, and of the members of each scoreboard, kept up to date on every score change
         with self.session_maker.begin() as session: # type: ignore
-            res = session.query(Challenge.idx).count()
+            self.scores = ScoreIndex(session.query(Auteur.idx, Auteur.username, Auteur.score).all())
+            self.scoreboard_scores = {name: ScoreIndex() for name, in session.query(Scoreboard.name).all()}
+            for name, idx in session.execute(select(association_table.c.scoreboard_name, association_table.c.auteur_id)):
+                if idx in self.scores:
+                    self.scoreboard_scores[name].update(idx, *self.scores.users[idx])
+
+        self.executor = DatabaseExecutor(DB_READERS)
+        self.catalog = CatalogStats()
+
+        self.poll_stats = {'skipped': 0, 'processed': 0}
+        self.transaction_stats = {}
+        self.stats_lock = threading.Lock()
+
+    @staticmethod
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        """Applies the SQLite profile to a new connection"""
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    def check_profile(self) -> dict:
+        """Reports the settings actually in use, a pragma can be ignored (no WAL on some filesystems)"""
+
+        with self.engine.connect() as conn:
+            active = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS}
+
+        print(f"SQLite profile : {', '.join(f'{name}={value}' for name, value in active.items())}")
+        if str(active['journal_mode']).lower() != 'wal':
+            print(f"SQLite journal mode is {active['journal_mode']}, readers will wait for writers")
+
+        return active
+
+    async def maintain(self) -> None:
+        """Lets SQLite refresh its statistics and folds the WAL back into the database"""
+
+        def query(session):
+            session.execute(text("PRAGMA optimize"))
+            return session.execute(text("PRAGMA wal_checkpoint(TRUNCATE)")).fetchone()
+
+        #In the writer thread, a checkpoint can not complete while a write is running
+        busy, wal_pages, checkpointed = await self.write('maintain', query)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Database maintenance : {checkpointed}/{wal_pages} WAL pages checkpointed{' (busy)' if busy else ''}")
+
+    @contextmanager
+    def transaction(self, name: str):
+        """Opens a session in a transaction, and records how long the operation held it"""
+        start = time.perf_counter()
+        try:
+            with self.session_maker.begin() as session: # type: ignore
+                yield session
+        finally:
+            held = time.perf_counter() - start
+            with self.stats_lock:
+                stats = self.transaction_stats.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+                stats['count'] += 1
+                stats['total'] += held
+                stats['max'] = max(stats['max'], held)
+            if held > DB_SLOW_TRANSACTION:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Transaction {name} held for {held * 1000:.0f} ms")
+
+    async def read(self, name: str, func):
+        """Runs func(session) in a reader thread, so that the event loop never waits on the database"""
+
+        def run():
+            with self.transaction(name) as session:
+                return func(session)
+
+        return await self.executor.read(run)
+
+    async def write(self, name: str, func):
+        """Runs func(session) in the writer thread, writes are serialized"""
+
+        def run():
+            with self.transaction(name) as session:
+                return func(session)
+
+        return await self.executor.write(run)
+
+    def update_score(self, idx: int, username: str, score: int) -> None:
+        """Moves a user in the score indexes"""
+        self.scores.update(idx, username, score)
+        for index in self.scoreboard_scores.values():
+            if idx in index:
+                index.update(idx, username, score)
+
+    def remove_score(self, idx: int) -> None:
+        self.scores.remove(idx)
+        for index in self.scoreboard_scores.values():
+            index.remove(idx)
+
+    def get_scoreboard_ranking(self, name: str, n: int = None) -> list[tuple[str, int]]:
+        """(username, score) of the n best users of a scoreboard, of all of them if n is None, None if it does not exist"""
+        index = self.scoreboard_scores.get(name)
+        if index is None:
+            return None
+        return index.top(n)
 
-        return res
+    def count_challenges(self) -> int:
+        """Counts number of challenges, used for initialization"""
+
+        return len(self.challenge_ids)
 
     async def add_challenge_to_db(self, idx: int, priority=1) -> Challenge:
         """Adds a Challenge to db from api"""
@@ -52,22 +171,36 @@ class DatabaseManager():
     async def get_challenge_from_db(self, idx: int) -> Challenge:
         """Retreives an Challenge from database"""
 
-        with self.session_maker.begin() as session: # type: ignore
-            chall = session.query(Challenge).filter(Challenge.idx == idx).one_or_none()
-        return chall
+        return await self.read('get_challenge_from_db', lambda session: session.query(Challenge).filter(Challenge.idx == idx).one_or_none())
 
 
+    async def get_sync_state(self) -> dict[str, int]:
+        """Returns the stored synchronization progress"""
+
+        return await self.read('get_sync_state', lambda session: {s.name: s.value for s in session.query(SyncState).all()})
+
+    async def set_sync_state(self, state: dict[str, int]) -> None:
+        """Stores the synchronization progress"""
+
+        def query(session):
+            for name, value in state.items():
+                session.merge(SyncState(name=name, value=value))
+
+        await self.write('set_sync_state', query)
+
     async def update_challenges(self, init=False) -> None:
-        """Retreives all challenges"""
+        """Synchronizes the challenges, only reading the newest listing pages unless a full scan is due"""
 
-        print("Updating all challenges...")
+        if not self.rootme_api.available():
+            print("Root-Me API unavailable, skipping challenges update")
+            return
 
-        with self.session_maker.begin() as session: # type: ignore
-            old_challs = session.query(Challenge).all()
-            old_ids = [c.idx for c in old_challs]
-            all_challenges = await self.rootme_api.fetch_all_challenges()
+        state = await self.get_sync_state()
+        runs = state.get('challenges_runs', 0)
+        full_scan = init or 'challenges_offset' not in state or runs >= CHALLENGE_FULL_SCAN_RUNS
+        start = 0 if full_scan else state['challenges_offset']
 
-            new_challenges = [new_chall for new_chall in all_challenges if new_chall.idx not in old_ids]
+        print(f"Updating challenges from offset {start}{' (full scan)' if full_scan else ''}...")
 
 
         async def get_new_chall(idx: int):
@@ -76,149 +209,290 @@ class DatabaseManager():
             except PremiumChallenge:
                 print(f"Could not retreive premium challenge {idx}")
                 return
+            except RequestFailed as e:
+                print(f"Could not retreive challenge {idx} : {e}")
+                return
 
             if full_chall == None:
                 print('Error in challenge')
                 return
 
-            with self.session_maker.begin() as session: # type: ignore
-                if temp_chall := session.query(Challenge.idx).filter(Challenge.idx == full_chall.idx).one_or_none():
-                    if temp_chall.score != full_chall.score:
-                        #In case of an update from Root-Me
-                        temp_chall.update(full_chall)
-                else:
-                    session.add(full_chall)
+            if full_chall.idx not in self.challenge_ids:
+                #A poll cycle may have added it meanwhile
+                await self.write('update_challenges', lambda session: session.merge(full_chall))
+                self.challenge_ids.add(full_chall.idx)
+                self.catalog.bump()
 
             if not init:
                 self.notification_manager.add_chall_to_queue(full_chall)
 
-        await asyncio.gather(*(get_new_chall(chall.idx) for chall in new_challenges))
+        #Details of new challenges are requested while the next listing pages are still being fetched
+        new_challenges = []
+        last_offset = start
+        try:
+            async for offset, page in self.rootme_api.iter_challenges(start):
+                last_offset = offset
+                new_challenges += [asyncio.create_task(get_new_chall(chall.idx)) for chall in page if chall.idx not in self.challenge_ids]
+        except RequestFailed as e:
+            #Keep the previous high-water mark, the next run will read these pages again
+            print(f"Could not fetch the challenge listing : {e}")
+            await asyncio.gather(*new_challenges)
+            return
+
+        await asyncio.gather(*new_challenges)
+
+        cursor = state.get('refresh_cursor', 0)
+        if not init:
+            cursor = await self.refresh_challenges(cursor)
+
+        await self.set_sync_state({
+            'challenges_offset': last_offset,
+            'challenges_runs': 0 if full_scan else runs + 1,
+            'refresh_cursor': cursor
+            })
 
         print("Done updating challenges !")
 
         return
 
+    async def refresh_challenges(self, cursor: int) -> int:
+        """Re-fetches the known challenges following the cursor, and returns the next cursor"""
+
+        ids = await self.read('refresh_challenges', lambda session: [
+            idx for idx, in session.query(Challenge.idx).filter(Challenge.idx > cursor).order_by(Challenge.idx).limit(CHALLENGE_REFRESH_SLICE).all()
+            ])
+
+        fulls = await asyncio.gather(*(self.rootme_api.get_challenge_by_id(idx, 2, refresh=True) for idx in ids), return_exceptions=True)
+
+        def query(session):
+            updated = 0
+            recount = []
+            for full_chall in fulls:
+                if not isinstance(full_chall, Challenge):
+                    continue
+
+                chall = session.query(Challenge).filter(Challenge.idx == full_chall.idx).one()
+                changed = False
+                for key in ('title', 'category', 'description', 'score', 'difficulty'):
+                    if getattr(chall, key) != getattr(full_chall, key):
+                        #In case of an update from Root-Me
+                        setattr(chall, key, getattr(full_chall, key))
+                        changed = True
+                        if key in ('category', 'score'):
+                            recount.append(chall.idx)
+                updated += changed
+
+            if recount:
+                #The stats of the solvers were computed with the old values
+                session.flush()
+                solvers = {idx for idx, in session.query(Validation.auteur_id).filter(Validation.challenge_id.in_(recount)).distinct()}
+                rebuild_category_stats(session, list(solvers))
+                rebuild_daily_scores(session, list(solvers))
+            return updated
+
+        updated = await self.write('refresh_challenges', query)
+        if updated:
+            self.catalog.bump()
+
+        print(f"Refreshed {len(ids)} challenges after {cursor}, {updated} updated")
+
+        #Start again from the first challenge once the end is reached
+        return ids[-1] if len(ids) == CHALLENGE_REFRESH_SLICE else 0
+
     async def get_all_users_from_db(self) -> list[Auteur]:
         """Returns all users in database in the form of Auteur"""
 
-        with self.session_maker.begin() as session: # type: ignore
-            sql_cmd = f"select username from auteurs;"
+        sql_cmd = f"select username from auteurs;"
 
-            users = session.execute(text(sql_cmd)).fetchall()
-            #users = session.query(Auteur).all()
+        users = await self.read('get_all_users_from_db', lambda session: session.execute(text(sql_cmd)).fetchall())
+        #users = session.query(Auteur).all()
 
         return users
 
     async def search_user_from_db(self, name: str) -> list[Auteur]:
         """Returns a list of users whose username contains the search"""
 
-        with self.session_maker.begin() as session: # type: ignore
-            users = session.query(Auteur).filter(Auteur.username.contains(name)).all()
+        users = await self.read('search_user_from_db', lambda session: session.query(Auteur).filter(Auteur.username.contains(name)).all())
 
         return users
 
     async def get_user_from_db(self, idx: int) -> Auteur:
         """Retreives an Auteur from database"""
 
-        with self.session_maker.begin() as session: # type: ignore
-            auteur = session.query(Auteur).where(Auteur.idx == idx).one_or_none()
-        return auteur
+        return await self.read('get_user_from_db', lambda session: session.query(Auteur).where(Auteur.idx == idx).one_or_none())
+
+    @staticmethod
+    def delete_auteur_data(session, idx: int) -> None:
+        """Deletes the validations and the derived rows of a user, before deleting it"""
+        chall_ids = [chall_idx for chall_idx, in session.query(Validation.challenge_id).filter(Validation.auteur_id == idx).all()]
+        session.query(Validation).filter(Validation.auteur_id == idx).delete()
+        session.query(AuteurState).filter(AuteurState.auteur_id == idx).delete()
+        session.query(AuteurCategoryStats).filter(AuteurCategoryStats.auteur_id == idx).delete()
+        session.query(DailyScore).filter(DailyScore.auteur_id == idx).delete()
+        #Its solves do not count anymore
+        rebuild_challenge_solvers(session, chall_ids)
 
     async def remove_user_from_db(self, idx: int) -> AuteurData:
         """Remove an Auteur from db by id"""
-        with self.session_maker.begin() as session: # type: ignore
+        def query(session):
             aut = session.query(Auteur).filter(Auteur.idx == idx).one_or_none()
             username = aut.username
-            aut.validations = []
+            self.delete_auteur_data(session, idx)
             session.delete(aut)
             return username
 
+        username = await self.write('remove_user_from_db', query)
+        self.remove_score(idx)
+        return username
+
 
     async def search_challenge_from_db(self, name: str) -> list[Challenge]:
         """Retreives a list of matching challenges in the db"""
-        with self.session_maker.begin() as session: # type: ignore
-            challs = session.query(Challenge).filter(Challenge.title.contains(name)).all()
+        challs = await self.read('search_challenge_from_db', lambda session: session.query(Challenge).filter(Challenge.title.contains(name)).all())
 
         return challs
 
+    async def get_solvers(self, idx: int) -> list[str]:
+        """Returns the usernames of the solvers of a challenge"""
+
+        def query(session):
+            return [username for username, in session.query(Auteur.username).join(Validation).filter(Validation.challenge_id == idx).all()]
+
+        return await self.read('get_solvers', query)
+
+    async def get_challenge_solvers(self, idx: int) -> ChallengeSolvers:
+        """Returns how many tracked users solved a challenge and when the first one did, None if nobody did"""
+
+        return await self.read('get_challenge_solvers', lambda session: session.get(ChallengeSolvers, idx))
+
 
 
     async def remove_user_from_db_by_name(self, name: str) -> list[str]:
         """Remove an Auteur from db by id"""
-        with self.session_maker.begin() as session: # type: ignore
+        def query(session):
 
+            removed = None
             aut = session.query(Auteur).filter(Auteur.username == name)
 
             if (v := aut.count()) == 1:
                 auteur = aut.one()
                 username = auteur.username
-                auteur.validations = []
+                self.delete_auteur_data(session, auteur.idx)
                 aut.delete()
+                removed = auteur.idx
                 ret = [username]
             elif v == 0:
                 ret = []
             else:
                 ret = aut.all()
+            return ret, removed
 
+        ret, removed = await self.write('remove_user_from_db_by_name', query)
+        if removed is not None:
+            self.remove_score(removed)
         return ret
 
-    async def retreive_user(self, idx: int, priority=1) -> Auteur:
+    async def retreive_user(self, idx: int, priority=1, conditional=False, watermark=None) -> Auteur:
         """Returns a Auteur populated properly"""
 
-        auteur = await self.rootme_api.get_user_by_id(idx, priority)
+        auteur = await self.rootme_api.get_user_by_id(idx, priority, conditional, watermark)
 
         return auteur
 
 
-    async def update_user(self, idx: int) -> None:
-        """Tries to update a user to database, if it doesn't exist return nothing"""
-        new_vals = []
-        #If the user already exists in our database
-
-        with self.session_maker.begin() as session:  # type: ignore
+    async def get_auteur_state(self, idx: int) -> AuteurState:
+        """Returns what was stored about the last processed payload of a user"""
 
-            challs_id = [i[0] for i in session.query(Challenge.idx).all()]
-            old_auteur = await self.get_user_from_db(idx)
-            old_id = [i.idx for i in session.merge(old_auteur).solves]
-            make_transient(old_auteur)
+        return await self.read('get_auteur_state', lambda session: session.query(AuteurState).filter(AuteurState.auteur_id == idx).one_or_none())
 
-            full_auteur = await self.retreive_user(idx)
-            full_auteur = session.merge(full_auteur)
+    async def update_user(self, idx: int, batch: PollBatch) -> None:
+        """Fetches a user and adds what changed to the batch of the poll cycle"""
 
-            for validation in full_auteur.validation_aut:
-                if validation.validation_challenge.idx not in challs_id:
-                    try:
-                        new_c = await self.add_challenge_to_db(validation.validation_challenge.idx, 0)
-                    except PremiumChallenge:
-                        print(f"Could not retreive premium challenge {idx}")
-                        continue
-                    if new_c:
-                        chall = session.merge(validation.validation_challenge)
-                        session.delete(chall)
-                        session.add(new_c)
+        state = await self.get_auteur_state(idx)
+        watermark = (state.last_validation, state.validation_count) if state else None
 
-                if validation.validation_challenge.idx not in old_id:
-                    new_vals.append(validation)
+        try:
+            full_auteur = await self.retreive_user(idx, conditional=True, watermark=watermark)
+        except NotModified:
+            #Nothing changed since the last poll
+            self.poll_stats['skipped'] += 1
+            return
+        except RequestFailed as e:
+            print(f"Could not update user {idx} : {e}")
+            return
+
+        if state and state.fingerprint == full_auteur.fingerprint:
+            #Same score, rank and validations as the last processed payload
+            self.rootme_api.commit_validators(self.rootme_api.user_key(idx))
+            self.poll_stats['skipped'] += 1
+            return
+
+        self.poll_stats['processed'] += 1
+        complete = True
+
+        #Only the validations since the watermark were extracted, the ones already stored are left out on write
+        for validation in full_auteur.validation_aut:
+            chall_idx = validation.validation_challenge.idx
+
+            if chall_idx not in self.challenge_ids and chall_idx not in batch.challenges:
+                try:
+                    new_c = await self.add_challenge_to_db(chall_idx, 1)
+                except PremiumChallenge:
+                    print(f"Could not retreive premium challenge {chall_idx}")
+                    new_c = None
+                except RequestFailed as e:
+                    #Extracted again on the next poll
+                    print(f"Could not retreive challenge {chall_idx} : {e}")
+                    complete = False
+                    continue
+                #The solve is kept against a placeholder when the challenge can't be read
+                batch.add_challenge(new_c or validation.validation_challenge)
+
+            batch.add_validation(validation.idx, idx, chall_idx, validation.date)
+
+        #The previous state is kept until the whole payload is applied, so that nothing suppresses the retry
+        batch.add_auteur(full_auteur, complete)
+
+    async def write_batch(self, batch: PollBatch) -> None:
+        """Writes a poll cycle in a single transaction, and enqueues the notifications of the new solves"""
+
+        def query(session):
+            solves = []
+            new_vals = batch.write(session)
+
+            auteurs = {aut.idx: aut for aut in session.query(Auteur).filter(Auteur.idx.in_({val['auteur_id'] for val in new_vals}))}
+            challenges = {chall.idx: chall for chall in session.query(Challenge).filter(Challenge.idx.in_({val['challenge_id'] for val in new_vals}))}
 
             for val in new_vals:
-                res = session.query(Auteur.username, Auteur.score).filter(Auteur.score > val.validation_auteur.score).order_by(Auteur.score.asc()).limit(1).one_or_none()
-                if res:
-                    user_above, user_score = res
+                #Among the first three tracked users to solve it
+                if val['position'] <= 3:
+                    is_blood = True
                 else:
-                    #First person in scoreboard
-                    user_above, user_score = ("", 0)
+                    is_blood = False
 
-                above = (user_above, user_score)
+                solves.append((auteurs[val['auteur_id']], challenges.get(val['challenge_id']), val['date'], is_blood))
+            return solves
 
-                if val.challenge_id:
-                    #Premium challenge are None, we can't notify them :(
-                    if len(val.validation_challenge.solvers) <= 3:
-                        is_blood = True
-                    else:
-                        is_blood = False
+        solves = await self.write('write_batch', query)
 
-                    self.notification_manager.add_solve_to_queue(val, above, is_blood)
+        #Only once they are committed
+        self.challenge_ids.update(batch.challenges)
+        if batch.challenges:
+            self.catalog.bump()
+        for idx in batch.written:
+            update = batch.auteurs[idx]
+            self.update_score(idx, update['b_username'], update['b_score'])
+            if idx in batch.states:
+                #The next poll can be answered with a 304 now that this payload is stored
+                self.rootme_api.commit_validators(self.rootme_api.user_key(idx))
 
+        for auteur, challenge, date, is_blood in solves:
+            if challenge is None or challenge.title is None:
+                #Stored against a placeholder of a premium challenge, there is nothing to show
+                continue
+            #("", 0) for the first person in scoreboard
+            above = self.scores.above(auteur.idx)
+            self.notification_manager.add_solve_to_queue(auteur, challenge, date, above, is_blood)
 
 
     async def search_user(self, username: str) -> list[Auteur]:
@@ -241,99 +515,121 @@ class DatabaseManager():
         """Adds a user from the api if we don't already have it"""
 
         aut = await self.get_user_from_db(idx)
-        if not aut:
-            with self.session_maker.begin() as session: # type: ignore
-                full_auteur = await self.retreive_user(idx, priority=0)
-                full_auteur = session.merge(full_auteur)
-                global_scoreboard = session.query(Scoreboard).where(Scoreboard.name == 'global').one()
-                full_auteur.scoreboards.append(global_scoreboard)
-                session.add(full_auteur)
-            return full_auteur
-        else:
+        if aut:
             return aut
 
+        full_auteur = await self.retreive_user(idx, priority=0)
+        chall_ids = {val.validation_challenge.idx for val in full_auteur.validation_aut}
+
+        def query(session):
+            merged = session.merge(full_auteur)
+            global_scoreboard = session.query(Scoreboard).where(Scoreboard.name == 'global').one()
+            merged.scoreboards.append(global_scoreboard)
+            session.add(merged)
+            session.flush()
+            rebuild_category_stats(session, [merged.idx])
+            rebuild_daily_scores(session, [merged.idx])
+            rebuild_challenge_solvers(session, list(chall_ids))
+            return merged
+
+        full_auteur = await self.write('add_user', query)
+
+        self.update_score(full_auteur.idx, full_auteur.username, full_auteur.score)
+        self.scoreboard_scores['global'].update(full_auteur.idx, full_auteur.username, full_auteur.score)
+
+        #The challenges of its validations are in database now
+        if chall_ids - self.challenge_ids:
+            self.catalog.bump()
+        self.challenge_ids.update(chall_ids)
+        return full_auteur
+
 
     async def update_users(self) -> None:
         """Updates all users"""
 
-        with self.session_maker.begin() as session: # type: ignore
-            await asyncio.gather(*(self.update_user(aut.idx) for aut in session.query(Auteur).all()))
+        if not self.rootme_api.available():
+            print("Root-Me API unavailable, skipping users update")
+            return
 
-        await asyncio.sleep(1)
+        before = dict(self.rootme_api.stats)
+        self.poll_stats = {'skipped': 0, 'processed': 0}
 
-    async def get_stats(self) -> dict:
-        """Queries db for how many chall per category"""
+        batch = PollBatch()
+        ids = await self.read('update_users', lambda session: [idx for idx, in session.query(Auteur.idx).all()])
 
-        with self.session_maker.begin() as session: # type: ignore
-            res = session.query(Challenge.category, func.count(Challenge.idx)).group_by(Challenge.category).all()
-            stats = {
-                Stats.APP_SCRIPT: next(x[1] for x in res if x[0] == 'App - Script'),
-                Stats.APP_SYSTEM: next(x[1] for x in res if x[0] == 'App - Système'),
-                Stats.CRACKING: next(x[1] for x in res if x[0] == 'Cracking'),
-                Stats.WEB_CLIENT: next(x[1] for x in res if x[0] == 'Web - Client'),
-                Stats.WEB_SERVER: next(x[1] for x in res if x[0] == 'Web - Serveur'),
-                Stats.FORENSICS: next(x[1] for x in res if x[0] == 'Forensic'),
-                Stats.REALIST: next(x[1] for x in res if x[0] == 'Réaliste'),
-                Stats.CRYPTANALYSIS: next(x[1] for x in res if x[0] == 'Cryptanalyse'),
-                Stats.NETWORK: next(x[1] for x in res if x[0] == 'Réseau'),
-                Stats.STEGANOGRAPHY: next(x[1] for x in res if x[0] == 'Stéganographie') ,
-                Stats.PROGRAMMING: next(x[1] for x in res if x[0] == 'Programmation')
-                                    }
+        await asyncio.gather(*(self.update_user(idx, batch) for idx in ids))
+
+        if batch:
+            await self.write_batch(batch)
+
+        stats = self.rootme_api.stats
+        if not_modified := stats['not_modified'] - before['not_modified']:
+            saved_bytes = stats['bytes_saved'] - before['bytes_saved']
+            saved_time = stats['parse_time_saved'] - before['parse_time_saved']
+            print(f"{not_modified} users not modified, saved {saved_bytes / 1024:.0f} KiB and {saved_time * 1000:.0f} ms of parsing")
+        print(f"Users update : {self.poll_stats['processed']} processed, {self.poll_stats['skipped']} skipped")
 
+        await asyncio.sleep(1)
+
+    async def get_catalog_stats(self) -> dict[str, dict]:
+        """Returns the challenges count, the total points and the difficulties count of each category"""
+
+        stats = self.catalog.get()
+        if stats is None:
+            version = self.catalog.version
+            rows = await self.read('get_catalog_stats', lambda session: session.query(
+                Challenge.category, Challenge.difficulty, func.count(Challenge.idx), func.coalesce(func.sum(Challenge.score), 0)
+                ).filter(Challenge.category.isnot(None)).group_by(Challenge.category, Challenge.difficulty).all())
+            stats = self.catalog.store(version, rows)
 
         return stats
 
-    async def get_stats_auteur(self, auteur: Auteur) -> dict:
-        """Queries db for the stats of a single auteur"""
+    async def get_stats(self) -> dict[str, int]:
+        """Returns how many chall per category"""
 
-        with self.session_maker.begin() as session: # type: ignore
+        return (await self.get_catalog_stats())['challenges']
 
-            auteur = session.merge(auteur)
+    async def get_stats_auteur(self, auteur: Auteur) -> dict[str, int]:
+        """Returns how many challenges of each category a user solved"""
 
-            solves = {
-                Stats.WEB_CLIENT : len([i for i in auteur.solves if i.category == 'Web - Client']),
-                Stats.APP_SCRIPT : len([i for i in auteur.solves if i.category == 'App - Script']),
-                Stats.PROGRAMMING : len([i for i in auteur.solves if i.category == 'Programmation']),
-                Stats.CRACKING : len([i for i in auteur.solves if i.category == 'Cracking']),
-                Stats.NETWORK : len([i for i in auteur.solves if i.category == 'Réseau']),
-                Stats.APP_SYSTEM : len([i for i in auteur.solves if i.category == 'App - Système']),
-                Stats.WEB_SERVER : len([i for i in auteur.solves if i.category == 'Web - Serveur']),
-                Stats.CRYPTANALYSIS : len([i for i in auteur.solves if i.category == 'Cryptanalyse']),
-                Stats.STEGANOGRAPHY : len([i for i in auteur.solves if i.category == 'Stéganographie']),
-                Stats.REALIST : len([i for i in auteur.solves if i.category == 'Réaliste']),
-                Stats.FORENSICS : len([i for i in auteur.solves if i.category == 'Forensic'])
-            }
+        def query(session):
+            return dict(session.query(AuteurCategoryStats.category, AuteurCategoryStats.solves).filter(AuteurCategoryStats.auteur_id == auteur.idx).all())
 
-        return solves
+        return await self.read('get_stats_auteur', query)
 
 
     async def get_scoreboard(self, name: str) -> Scoreboard:
         """Retreives a scoreboard from db by name"""
 
-        with self.session_maker.begin() as session: # type: ignore
-            scoreboard = session.query(Scoreboard).filter(Scoreboard.name == name).one_or_none()
-        return scoreboard
+        return await self.read('get_scoreboard', lambda session: session.query(Scoreboard).filter(Scoreboard.name == name).one_or_none())
 
     def get_all_scoreboards(self) -> list[Scoreboard]:
-        """Retreives all scoreboards"""
-        with self.session_maker.begin() as session: # type: ignore
+        """Retreives all scoreboards, synchronously as views need them in their constructor"""
+        with self.transaction('get_all_scoreboards') as session:
             scoreboard = session.query(Scoreboard).all()
         return scoreboard
 
     async def create_scoreboard(self, name: str) -> Scoreboard:
         """Creates a scoreboard """
-        with self.session_maker.begin() as session: # type: ignore
-            scoreboard = await self.get_scoreboard(name)
+
+        def query(session):
+            scoreboard = session.query(Scoreboard).filter(Scoreboard.name == name).one_or_none()
             if not scoreboard:
                 scoreboard = Scoreboard(name=name)
                 session.add(scoreboard)
+            return scoreboard
+
+        scoreboard = await self.write('create_scoreboard', query)
+        self.scoreboard_scores.setdefault(name, ScoreIndex())
         return scoreboard
     
     async def get_daily_scoreboard(self) -> Scoreboard:
         """Creates a scoreboard """
+        sql_cmd = text("select a.username,sum(d.points) from daily_scores as d,auteurs as a where d.day = :today and d.auteur_id==a.idx group by 1;")
+        #Same day as DATE('now'), in UTC
+        today = int(time.time() // 86400)
         try:
-            with self.session_maker.begin() as session: # type: ignore
-                scoreboard = session.execute(text("select a.username,sum(c.score) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)==DATE('now') and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1;")).fetchall()
+            scoreboard = await self.read('get_daily_scoreboard', lambda session: session.execute(sql_cmd, {'today': today}).fetchall())
             print('sc2',scoreboard)
         except Exception as e:
             print(e)
@@ -342,26 +638,24 @@ class DatabaseManager():
     async def get_val_range(self, start):
         """Get all flag in a time range"""
         try:
-            with self.session_maker.begin() as session: # type: ignore
-                #sql_cmd = f"select a.username,c.score,SUBSTR(v.date,0,11) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)>='{start}' and v.auteur_id==a.idx and v.challenge_id==c.idx ;"
-                sql_cmd = f"select a.username,sum(c.score),SUBSTR(v.date,0,11) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)>='{start}' and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1,3;"
-                print(sql_cmd)
-                val = session.execute(text(sql_cmd)).fetchall()
+            sql_cmd = text("select a.username,sum(d.points),date(d.day * 86400, 'unixepoch') from daily_scores as d,auteurs as a where d.day >= :start and d.auteur_id==a.idx group by 1,d.day;")
+            start_day = epoch_day(datetime.fromisoformat(start))
+            val = await self.read('get_val_range', lambda session: session.execute(sql_cmd, {'start': start_day}).fetchall())
             #print('sc2',val)
         except Exception as e:
             print(e)
         return val
 
     async def get_val_range_sum(self, start):
-        with self.session_maker.begin() as session:
-            sql_cmd = f"select a.username,sum(c.score),SUBSTR(v.date,0,11) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)>='{start}' and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1;"
-            val = session.execute(text(sql_cmd)).fetchall()
+        sql_cmd = text("select a.username,sum(d.points),date(max(d.day) * 86400, 'unixepoch') from daily_scores as d,auteurs as a where d.day >= :start and d.auteur_id==a.idx group by 1;")
+        start_day = epoch_day(datetime.fromisoformat(start))
+        val = await self.read('get_val_range_sum', lambda session: session.execute(sql_cmd, {'start': start_day}).fetchall())
         return val
 
     async def remove_scoreboard(self, name: str) -> bool:
         """Removes a scoreboard"""
 
-        with self.session_maker.begin() as session: # type: ignore
+        def query(session):
             scoreboard = session.query(Scoreboard).filter(Scoreboard.name == name).one_or_none()
             if not scoreboard:
                 res = False
@@ -369,12 +663,17 @@ class DatabaseManager():
                 res = True
                 scoreboard.users = []
                 session.delete(scoreboard)
+            return res
+
+        res = await self.write('remove_scoreboard', query)
+        if res:
+            self.scoreboard_scores.pop(name, None)
         return res
 
     async def add_to_scoreboard(self, user_id: int, scoreboard_name: str) -> bool:
         """Adds a user to a scoreboard"""
 
-        with self.session_maker.begin() as session: # type: ignore
+        def query(session):
             aut = session.query(Auteur).filter(Auteur.idx == user_id).one_or_none()
             scoreboard = session.query(Scoreboard).filter(Scoreboard.name == scoreboard_name).one_or_none()
             if not aut or not scoreboard:
@@ -382,13 +681,17 @@ class DatabaseManager():
             else:
                 aut.scoreboards.append(scoreboard)
                 res = True
+            return res
 
+        res = await self.write('add_to_scoreboard', query)
+        if res and user_id in self.scores:
+            self.scoreboard_scores[scoreboard_name].update(user_id, *self.scores.users[user_id])
         return res
 
     async def remove_from_scoreboard(self, user_id: int, scoreboard_name: str) -> bool:
         """Remove a user from a scoreboard"""
 
-        with self.session_maker.begin() as session: # type: ignore
+        def query(session):
             aut = session.query(Auteur).filter(Auteur.idx == user_id).one_or_none()
             scoreboard = session.query(Scoreboard).filter(Scoreboard.name == scoreboard_name).one_or_none()
             if not aut or not scoreboard:
@@ -399,4 +702,9 @@ class DatabaseManager():
                     res = True
                 else:
                     res = False
+            return res
+
+        res = await self.write('remove_from_scoreboard', query)
+        if res:
+            self.scoreboard_scores[scoreboard_name].remove(user_id)
         return res
@@ -0,0 +1,70 @@
+"""Module for the database schema migrations"""
+from sqlalchemy.engine import Connection, Engine
+
+from database.models.category_stats_model import rebuild_category_stats
+from database.models.challenge_solvers_model import rebuild_challenge_solvers
+from database.models.daily_score_model import rebuild_daily_scores
+
+#Days since 1970-01-01 of a stored 'YYYY-MM-DD HH:MM:SS' date
+SQL_EPOCH_DAY = "CAST(julianday(substr(date, 1, 10)) - 2440587.5 AS INTEGER)"
+
+
+def column_names(conn: Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def add_auteur_state_fingerprint(conn: Connection) -> None:
+    """Payload fingerprint of the users"""
+    if 'fingerprint' not in column_names(conn, 'auteur_states'):
+        conn.exec_driver_sql("ALTER TABLE auteur_states ADD COLUMN fingerprint TEXT")
+
+
+def add_indexes_and_validation_day(conn: Connection) -> None:
+    """Indexes on validations and auteurs, and an indexed day column on validations"""
+    if 'day' not in column_names(conn, 'validations'):
+        conn.exec_driver_sql("ALTER TABLE validations ADD COLUMN day INTEGER")
+    conn.exec_driver_sql(f"UPDATE validations SET day = {SQL_EPOCH_DAY} WHERE day IS NULL")
+
+    #Same names as the ones create_all gives to the indexes declared on the models
+    for table, column in (('validations', 'auteur_id'), ('validations', 'challenge_id'), ('validations', 'day'), ('auteurs', 'username'), ('auteurs', 'score')):
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+
+
+def build_category_stats(conn: Connection) -> None:
+    """Per user and category stats, computed from the stored validations"""
+    rebuild_category_stats(conn)
+
+
+def build_challenge_solvers(conn: Connection) -> None:
+    """Solvers count and first solve date of the challenges, computed from the stored validations"""
+    rebuild_challenge_solvers(conn)
+
+
+def build_daily_scores(conn: Connection) -> None:
+    """Points and solves of the users per day, computed from the stored validations"""
+    rebuild_daily_scores(conn)
+
+
+#The schema version is the number of migrations applied, stored in PRAGMA user_version.
+#Migrations also run on databases freshly created by create_all, so they must not fail when the change is already there.
+MIGRATIONS = [
+    add_auteur_state_fingerprint,
+    add_indexes_and_validation_day,
+    build_category_stats,
+    build_challenge_solvers,
+    build_daily_scores,
+]
+
+
+def migrate(engine: Engine) -> int:
+    """Applies the missing migrations, and returns the schema version"""
+
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            print(f"Migrating database to version {number} : {migration.__doc__}")
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+    return len(MIGRATIONS)
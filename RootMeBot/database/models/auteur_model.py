@@ -7,10 +7,15 @@ class Auteur(Base):
     """Class that represent a user"""
     __tablename__ = 'auteurs'
     idx = Column(Integer, primary_key=True)
-    username = Column(Text)
-    score = Column(Integer)
+    username = Column(Text, index=True)
+    score = Column(Integer, index=True)
     rank = Column(Text)
 
+    #Not stored, (newest validation date, validations count) of the payload it was extracted from
+    watermark = None
+    #Not stored, summary of the payload it was extracted from, equal for unchanged payloads
+    fingerprint = None
+
     def __str__(self) -> str:
         return (
             f"User {self.username}-{self.idx}: "
@@ -0,0 +1,16 @@
+"""Module for the AuteurState class"""
+from database.models.base_model import Base
+from sqlalchemy import Column, ForeignKey, Integer, Text
+
+
+class AuteurState(Base):
+    """Class that stores what was last processed for a user"""
+
+    __tablename__ = 'auteur_states'
+    auteur_id = Column(Integer, ForeignKey('auteurs.idx'), primary_key=True)
+    last_validation = Column(Text)
+    validation_count = Column(Integer)
+    fingerprint = Column(Text)
+
+    def __str__(self) -> str:
+        return f"AuteurState {self.auteur_id}: {self.validation_count} validations, last at {self.last_validation}"
@@ -0,0 +1,42 @@
+"""Module for the AuteurCategoryStats class"""
+from database.models.base_model import Base
+from sqlalchemy import Column, ForeignKey, Integer, Text, bindparam
+from sqlalchemy.sql import text
+
+
+class AuteurCategoryStats(Base):
+    """Class that stores how many challenges of a category a user solved, kept up to date with the validations"""
+
+    __tablename__ = 'auteur_category_stats'
+    auteur_id = Column(Integer, ForeignKey('auteurs.idx'), primary_key=True)
+    category = Column(Text, primary_key=True)
+    solves = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+
+    def __str__(self) -> str:
+        return f"AuteurCategoryStats {self.auteur_id} {self.category}: {self.solves} solves, {self.points} points"
+
+
+SELECT_STATS = (
+    "select v.auteur_id, c.category, count(*), coalesce(sum(c.score), 0) from validations as v "
+    "join challenges as c on v.challenge_id = c.idx where c.category is not null"
+)
+
+
+def rebuild_category_stats(connection, auteur_ids: list[int] = None) -> None:
+    """Computes the stats again from the validations, of all users or only of the given ones"""
+
+    if auteur_ids is None:
+        connection.execute(text("delete from auteur_category_stats"))
+        connection.execute(text(f"insert into auteur_category_stats (auteur_id, category, solves, points) {SELECT_STATS} group by 1, 2"))
+        return
+
+    if not auteur_ids:
+        return
+
+    ids = bindparam('ids', expanding=True)
+    connection.execute(text("delete from auteur_category_stats where auteur_id in :ids").bindparams(ids), {'ids': list(auteur_ids)})
+    connection.execute(
+        text(f"insert into auteur_category_stats (auteur_id, category, solves, points) {SELECT_STATS} and v.auteur_id in :ids group by 1, 2").bindparams(ids),
+        {'ids': list(auteur_ids)}
+        )
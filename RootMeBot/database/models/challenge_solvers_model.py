@@ -0,0 +1,38 @@
+"""Module for the ChallengeSolvers class"""
+from database.models.base_model import Base
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, bindparam
+from sqlalchemy.sql import text
+
+
+class ChallengeSolvers(Base):
+    """Class that stores how many tracked users solved a challenge, and when the first one did"""
+
+    __tablename__ = 'challenge_solvers'
+    challenge_id = Column(Integer, ForeignKey('challenges.idx'), primary_key=True)
+    solvers = Column(Integer, nullable=False, default=0)
+    first_solve = Column(DateTime)
+
+    def __str__(self) -> str:
+        return f"ChallengeSolvers {self.challenge_id}: {self.solvers} solvers, first at {self.first_solve}"
+
+
+SELECT_SOLVERS = "select challenge_id, count(*), min(date) from validations"
+
+
+def rebuild_challenge_solvers(connection, challenge_ids: list[int] = None) -> None:
+    """Counts the solvers again from the validations, of all challenges or only of the given ones"""
+
+    if challenge_ids is None:
+        connection.execute(text("delete from challenge_solvers"))
+        connection.execute(text(f"insert into challenge_solvers (challenge_id, solvers, first_solve) {SELECT_SOLVERS} group by 1"))
+        return
+
+    if not challenge_ids:
+        return
+
+    ids = bindparam('ids', expanding=True)
+    connection.execute(text("delete from challenge_solvers where challenge_id in :ids").bindparams(ids), {'ids': list(challenge_ids)})
+    connection.execute(
+        text(f"insert into challenge_solvers (challenge_id, solvers, first_solve) {SELECT_SOLVERS} where challenge_id in :ids group by 1").bindparams(ids),
+        {'ids': list(challenge_ids)}
+        )
@@ -0,0 +1,43 @@
+"""Module for the DailyScore class"""
+from database.models.base_model import Base
+from sqlalchemy import Column, ForeignKey, Integer, bindparam
+from sqlalchemy.sql import text
+
+
+class DailyScore(Base):
+    """Class that stores the points and solves of a user on a day, kept up to date with the validations"""
+
+    __tablename__ = 'daily_scores'
+    #Same as Validation.day, days since 1970-01-01
+    day = Column(Integer, primary_key=True)
+    auteur_id = Column(Integer, ForeignKey('auteurs.idx'), primary_key=True, index=True)
+    points = Column(Integer, nullable=False, default=0)
+    solves = Column(Integer, nullable=False, default=0)
+
+    def __str__(self) -> str:
+        return f"DailyScore {self.auteur_id} on day {self.day}: {self.points} points, {self.solves} solves"
+
+
+SELECT_DAILY = (
+    "select v.day, v.auteur_id, coalesce(sum(c.score), 0), count(*) from validations as v "
+    "join challenges as c on v.challenge_id = c.idx where v.day is not null"
+)
+
+
+def rebuild_daily_scores(connection, auteur_ids: list[int] = None) -> None:
+    """Computes the rollup again from the validations, of all users or only of the given ones"""
+
+    if auteur_ids is None:
+        connection.execute(text("delete from daily_scores"))
+        connection.execute(text(f"insert into daily_scores (day, auteur_id, points, solves) {SELECT_DAILY} group by 1, 2"))
+        return
+
+    if not auteur_ids:
+        return
+
+    ids = bindparam('ids', expanding=True)
+    connection.execute(text("delete from daily_scores where auteur_id in :ids").bindparams(ids), {'ids': list(auteur_ids)})
+    connection.execute(
+        text(f"insert into daily_scores (day, auteur_id, points, solves) {SELECT_DAILY} and v.auteur_id in :ids group by 1, 2").bindparams(ids),
+        {'ids': list(auteur_ids)}
+        )
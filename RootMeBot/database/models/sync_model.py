@@ -0,0 +1,14 @@
+"""Module for the SyncState class"""
+from database.models.base_model import Base
+from sqlalchemy import Column, Integer, Text
+
+
+class SyncState(Base):
+    """Class that stores the progress of incremental synchronizations"""
+
+    __tablename__ = 'sync_state'
+    name = Column(Text, primary_key=True)
+    value = Column(Integer)
+
+    def __str__(self) -> str:
+        return f"SyncState {self.name}: {self.value}"
@@ -1,4 +1,6 @@
 """Module for the Validation class"""
+from datetime import datetime
+
 from database.models.auteur_model import Auteur
 from database.models.base_model import Base
 from database.models.challenge_model import Challenge
@@ -12,9 +14,11 @@ class Validation(Base):
 
     __tablename__ = 'validations'
     idx = Column(Text, primary_key=True)
-    auteur_id = Column(Integer, ForeignKey('auteurs.idx'), nullable=False)
-    challenge_id = Column(Integer, ForeignKey('challenges.idx'), nullable=False)
+    auteur_id = Column(Integer, ForeignKey('auteurs.idx'), nullable=False, index=True)
+    challenge_id = Column(Integer, ForeignKey('challenges.idx'), nullable=False, index=True)
     date = Column(DateTime)
+    #Days since 1970-01-01, so that date ranges can use an index
+    day = Column(Integer, index=True)
 
     validation_auteur = relationship(Auteur, backref="validation_aut")
     validation_challenge = relationship(Challenge, backref="validation_chall")
@@ -23,5 +27,13 @@ class Validation(Base):
         return f'Validation : {self.challenge_id} by {self.auteur_id} at {self.date}'
 
 
+EPOCH = datetime(1970, 1, 1).date()
+
+
+def epoch_day(date: datetime) -> int:
+    """Value of the day column for a date"""
+    return (date.date() - EPOCH).days
+
+
 Challenge.solvers = association_proxy("validation_chall", "validation_auteur")
 Auteur.solves = association_proxy("validation_aut", "validation_challenge")
@@ -0,0 +1,50 @@
+"""Module for the ScoreIndex"""
+from bisect import bisect_left, insort
+
+
+class ScoreIndex():
+    """Users ordered by score, to find who is above someone, its rank and the top without querying the database"""
+
+    def __init__(self, users: list[tuple[int, str, int]] = ()) -> None:
+        self.users = {idx: (username, score or 0) for idx, username, score in users}
+        #(-score, idx) so that the best scores come first and equal scores keep a stable order
+        self.entries = sorted((-score, idx) for idx, (_, score) in self.users.items())
+
+    def __contains__(self, idx: int) -> bool:
+        return idx in self.users
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def update(self, idx: int, username: str, score: int) -> None:
+        """Adds a user, or moves it to its new score"""
+        score = score or 0
+        if idx in self.users:
+            old = (-self.users[idx][1], idx)
+            del self.entries[bisect_left(self.entries, old)]
+
+        self.users[idx] = (username, score)
+        insort(self.entries, (-score, idx))
+
+    def remove(self, idx: int) -> None:
+        if idx not in self.users:
+            return
+        _, score = self.users.pop(idx)
+        del self.entries[bisect_left(self.entries, (-score, idx))]
+
+    def above(self, idx: int) -> tuple[str, int]:
+        """The user with the lowest score higher than the one of idx, ("", 0) if idx is first"""
+        position = bisect_left(self.entries, (-self.users[idx][1],))
+        if position == 0:
+            return ("", 0)
+
+        _, above_idx = self.entries[position - 1]
+        return self.users[above_idx]
+
+    def rank(self, idx: int) -> int:
+        """1 + the number of users with a higher score"""
+        return bisect_left(self.entries, (-self.users[idx][1],)) + 1
+
+    def top(self, n: int = None) -> list[tuple[str, int]]:
+        """(username, score) of the n best users, of all of them if n is None"""
+        return [self.users[idx] for _, idx in self.entries[:n]]
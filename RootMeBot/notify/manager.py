@@ -1,9 +1,11 @@
 """Module that manages sending notification on discord"""
+from datetime import datetime
+
 from classes.auteur import AuteurData
 from classes.challenge import ChallengeData
 
 
-Solves = list[tuple[AuteurData, ChallengeData, int, bool]]
+Solves = list[tuple[AuteurData, ChallengeData, datetime, tuple[str, int], bool]]
 Challenges = list[ChallengeData]
 Solve = tuple[AuteurData, ChallengeData]
 
@@ -16,15 +18,13 @@ class NotificationManager():
         self.new_solves = []
 
 
-    def add_solve_to_queue(self, val: Solve, above: tuple[str, int], is_blood: bool) -> None:
+    def add_solve_to_queue(self, auteur: AuteurData, challenge: ChallengeData, date: datetime, above: tuple[str, int], is_blood: bool) -> None:
         """Adds a new solve by someone in the queue"""
-        auteur = val.validation_auteur # type: ignore
-        challenge = val.validation_challenge # type: ignore
 
         if not challenge:
             return
 
-        self.new_solves.append((auteur, challenge, above, is_blood))
+        self.new_solves.append((auteur, challenge, date, above, is_blood))
 
     def get_solve_queue(self) -> Solves:
         """Returns the currently enqueued solves"""
@@ -44,5 +44,5 @@ class NotificationManager():
 
     def __str__(self) -> str:
         output = f"""Challenge queue : [{', '.join([str(chall.idx) for chall in self.new_challenges])}]\n"""
-        output += f"""Solves in queue : [{', '.join([str(chall.idx) + ' by ' + aut.username for aut, chall, _ in self.new_solves])}]"""
+        output += f"""Solves in queue : [{', '.join([str(chall.idx) + ' by ' + aut.username for aut, chall, *_ in self.new_solves])}]"""
         return output
@@ -2,6 +2,7 @@ import discord
 import aiohttp
 import code
 import traceback
+from datetime import datetime
 from html import unescape
 
 from discord.utils import escape_markdown
@@ -9,7 +10,7 @@ from discord.channel import TextChannel
 
 from database.manager import DatabaseManager
 
-from classes.enums import Color, Stats
+from classes.enums import Color
 from classes.views import ManageView, ScoreboardView, MultipleChallFoundView, MultipleUserFoundView
 from constants import PING_DEV, PING_ROLE_ROOTME
 
@@ -75,7 +76,7 @@ async def panic_message(channel: TextChannel, error, where):
         await channel.send(ping,embed=embed)
 
 
-async def send_new_solve(channel: TextChannel, chall: Challenge, aut: Auteur, above: tuple[str, int], is_blood: bool) -> None:
+async def send_new_solve(channel: TextChannel, chall: Challenge, aut: Auteur, date: datetime, above: tuple[str, int], is_blood: bool) -> None:
     """Posts a new solve in the right channel"""
 
     if is_blood:
@@ -87,13 +88,11 @@ async def send_new_solve(channel: TextChannel, chall: Challenge, aut: Auteur, ab
 
     message_title = f'New challenge solved by {escape_markdown(aut.username)} {emoji}'
 
-    val = [val for val in chall.validation_chall if val.auteur_id == aut.idx][0]
-
     message = f' • {unescape(chall.title)} ({chall.score} points)'
     message += f'\n • Category: {chall.category}'
     message += f'\n • Difficulty: {chall.difficulty}'
     message += f'\n • New score: {aut.score}'
-    message += f'\n • Date: {val.date.strftime("%d/%m/%y %Hh%Mm%Ss")}'
+    message += f'\n • Date: {date.strftime("%d/%m/%y %Hh%Mm%Ss")}'
 
     embed = discord.Embed(color=Color.NEW_YELLOW.value, title=message_title, description=message)
 
@@ -138,22 +137,20 @@ async def show_image(channel: TextChannel) -> None:
 
 async def scoreboard(channel: TextChannel, database_manager: DatabaseManager, name: str) -> None:
 
-    sc = await database_manager.get_scoreboard(name)
-    if not sc:
+    #Already ordered by score
+    users = database_manager.get_scoreboard_ranking(name)
+    if users is None:
         await utils.cant_find_scoreboard(channel, name)
         return
 
-    users = sc.users
-
     if not users:
-       embed = discord.Embed(color=0xff0000, title='Error', description=f'No users in scoreboard {sc.name} :frowning:')
+       embed = discord.Embed(color=0xff0000, title='Error', description=f'No users in scoreboard {name} :frowning:')
 
     else:
-       users.sort(key=lambda x: x.score, reverse=True)
-       message_title = f'Scoreboard {sc.name}'
+       message_title = f'Scoreboard {name}'
        message = ''
-       for user in users:
-           message += f' • • • {escape_markdown(user.username)} --> {user.score} \n'
+       for username, score in users:
+           message += f' • • • {escape_markdown(username)} --> {score} \n'
 
        embed = discord.Embed(color=Color.SCOREBOARD_WHITE.value, title=message_title, description=message)
 
@@ -233,20 +230,17 @@ async def many_users(channel: TextChannel, auteurs: Auteurs) -> None:
     await channel.send(embed=embed)
 
 
-async def who_solved(channel: TextChannel, chall: Challenge, Session) -> None:
+async def who_solved(channel: TextChannel, chall: Challenge, database_manager: DatabaseManager) -> None:
 
     message_title = f'Solvers of {unescape(chall.title)} :sunglasses:'
     message = ''
-    with Session.begin() as session:
-        chall = session.merge(chall)
-
-        for auteur in chall.solvers:
-            if auteur is None:
-                continue
-            message += f' • • • {escape_markdown(auteur.username)}\n'
+    for username in await database_manager.get_solvers(chall.idx):
+        message += f' • • • {escape_markdown(username)}\n'
 
 
     embed = discord.Embed(color=Color.INFO_BLUE.value, title=message_title, description=message)
+    if solvers := await database_manager.get_challenge_solvers(chall.idx):
+        embed.set_footer(text=f'{solvers.solvers} solvers, first solve on {solvers.first_solve.strftime("%d/%m/%y")}')
     await channel.send(embed=embed)
 
 
@@ -267,11 +261,11 @@ async def many_challenges(channel: TextChannel, challenges: Challenges) -> None:
 
     await channel.send(embed=embed)
 
-async def multiple_challenges(channel: TextChannel, challenges: Challenges, Session) -> None:
+async def multiple_challenges(channel: TextChannel, challenges: Challenges, database_manager: DatabaseManager) -> None:
 
     message = f'Multiple challenges found :'
 
-    view = MultipleChallFoundView(channel, challenges, Session)
+    view = MultipleChallFoundView(channel, challenges, database_manager)
 
     await channel.send(message, view=view)
 
@@ -296,35 +290,20 @@ async def multiple_users(channel: TextChannel, auteurs: Auteurs) -> None:
     await channel.send(embed=embed)
 
 
-async def profile(channel: TextChannel, data: tuple[str, int, int], solves: dict, stats_glob: list[int], image_url: str) -> None:
+async def profile(channel: TextChannel, data: tuple[str, int, int], solves: dict[str, int], stats_glob: dict[str, int], image_url: str) -> None:
 
     username, score, rank = data
 
     message_title = f'Profile of {username}'
 
-    first_column = f'**\nWeb Client**'
-    first_column += f'\n{solves[Stats.WEB_CLIENT]}/{stats_glob[Stats.WEB_CLIENT]}'
-    first_column += f'\n**App-Script**'
-    first_column += f'\n{solves[Stats.APP_SCRIPT]}/{stats_glob[Stats.APP_SCRIPT]}'
-    first_column += f'\n**Programmation**'
-    first_column += f'\n{solves[Stats.PROGRAMMING]}/{stats_glob[Stats.PROGRAMMING]}'
-    first_column += f'\n**Cracking**'
-    first_column += f'\n{solves[Stats.CRACKING]}/{stats_glob[Stats.CRACKING]}'
-    first_column += f'\n**Reseau**'
-    first_column += f'\n{solves[Stats.NETWORK]}/{stats_glob[Stats.NETWORK]}'
-    first_column += f'\n**App-Système**'
-    first_column += f'\n{solves[Stats.APP_SYSTEM]}/{stats_glob[Stats.APP_SYSTEM]}'
-
-    second_column = f'**\nWeb Serveur**'
-    second_column += f'\n{solves[Stats.WEB_SERVER]}/{stats_glob[Stats.WEB_SERVER]}'
-    second_column += f'\n**Cryptanalyse**'
-    second_column += f'\n{solves[Stats.CRYPTANALYSIS]}/{stats_glob[Stats.CRYPTANALYSIS]}'
-    second_column += f'\n**Steganographie**'
-    second_column += f'\n{solves[Stats.STEGANOGRAPHY]}/{stats_glob[Stats.STEGANOGRAPHY]}'
-    second_column += f'\n**Realiste**'
-    second_column += f'\n{solves[Stats.REALIST]}/{stats_glob[Stats.REALIST]}'
-    second_column += f'\n**Forensic**'
-    second_column += f'\n{solves[Stats.FORENSICS]}/{stats_glob[Stats.FORENSICS]}'
+    #Categories are the ones of the challenges in database, split between the two columns
+    categories = sorted(stats_glob)
+    half = (len(categories) + 1) // 2
+    columns = ['', '']
+    for i, category in enumerate(categories):
+        columns[i >= half] += f'**\n{category}**'
+        columns[i >= half] += f'\n{solves.get(category, 0)}/{stats_glob[category]}'
+    first_column, second_column = columns[0] or '**\n**', columns[1] or '**\n**'
 
     embed = discord.Embed(color=Color.INFO_BLUE.value, title=message_title)
 
@@ -339,6 +318,70 @@ async def profile(channel: TextChannel, data: tuple[str, int, int], solves: dict
 
 
 
+async def request_failed(channel: TextChannel, error) -> None:
+
+    message_title = 'Error'
+    message = f'Root-Me did not answer in time, please try again later :hourglass:\n{error.reason}'
+
+    embed = discord.Embed(color=Color.ERROR_RED.value, title=message_title, description=message)
+    await channel.send(embed=embed)
+
+async def banned(channel: TextChannel, until) -> None:
+
+    message_title = 'Error'
+    message = f'The bot is rate-limited by Root-Me until {until.strftime("%H:%M:%S")}, please try again later :no_entry:'
+
+    embed = discord.Embed(color=Color.ERROR_RED.value, title=message_title, description=message)
+    await channel.send(embed=embed)
+
+async def cache_stats(channel: TextChannel, stats: dict, sizes: dict) -> None:
+
+    message_title = 'API cache'
+    message = ''
+    for endpoint, counters in stats.items():
+        total = counters['hits'] + counters['misses']
+        ratio = 100 * counters['hits'] / total if total else 0
+        message += f' • • • {endpoint}: {sizes.get(endpoint, 0)} entries, {counters["hits"]} hits / {counters["misses"]} misses ({ratio:.0f}%), {counters["suppressed"]} unavailable requests suppressed\n'
+
+    embed = discord.Embed(color=Color.INFO_BLUE.value, title=message_title, description=message)
+    await channel.send(embed=embed)
+
+async def cache_cleared(channel: TextChannel, endpoint: str, removed: int) -> None:
+
+    message_title = 'Success'
+    message = f'Removed {removed} {endpoint or "cached"} entries :wastebasket:'
+
+    embed = discord.Embed(color=Color.SUCCESS_GREEN.value, title=message_title, description=message)
+    await channel.send(embed=embed)
+
+
+async def queue_stats(channel: TextChannel, lanes) -> None:
+
+    message_title = 'API queues'
+    embed = discord.Embed(color=Color.INFO_BLUE.value, title=message_title)
+
+    for lane in lanes:
+        message = ''
+        for priority, stats in lane.scheduler.stats.items():
+            average = stats['wait'] / stats['served'] if stats['served'] else 0
+            message += f'\n • Priority {priority}: {len(lane.scheduler.queues[priority])} queued, {stats["served"]} served'
+            message += f', wait {average:.1f}s avg / {stats["max_wait"]:.1f}s max, {stats["deferred"]} deferred, {stats["shed"]} shed'
+        embed.add_field(name=f'{lane.host} ({lane.bucket.rate:.1f} req/s)', value=message, inline=False)
+
+    await channel.send(embed=embed)
+
+async def db_stats(channel: TextChannel, stats: dict, lag: dict) -> None:
+
+    message_title = 'Database transactions'
+    message = ''
+    for name, counters in sorted(stats.items(), key=lambda item: -item[1]['total']):
+        average = counters['total'] / counters['count']
+        message += f' • • • {name}: {counters["count"]} held {average * 1000:.1f} ms avg / {counters["max"] * 1000:.0f} ms max\n'
+    message += f'\nEvent loop lag: {lag["average"] * 1000:.1f} ms avg, {lag["p99"] * 1000:.0f} ms p99, {lag["max"] * 1000:.0f} ms max'
+
+    embed = discord.Embed(color=Color.INFO_BLUE.value, title=message_title, description=message)
+    await channel.send(embed=embed)
+
 async def usage(channel: TextChannel) -> None:
 
 
@@ -0,0 +1,92 @@
+"""Requests/s reached by ApiRootMe's lane workers against a local stub of the Root-Me API
+
+    python benchmarks/api_throughput.py --requests 200 --latency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RootMeBot'))
+
+import api.fetch as fetch
+from api.fetch import ApiRootMe, Lane
+from constants import API_DEFAULT_HOST, API_LANES
+
+
+def stub_app(latency: float, throttle: float) -> web.Application:
+    """Answers every user after latency seconds, or a 429 with a fraction throttle of the calls"""
+
+    async def auteur(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        if random.random() < throttle:
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        return web.json_response({'id_auteur': request.match_info['idx'], 'nom': 'user', 'score': '0', 'position': '', 'validations': []})
+
+    app = web.Application()
+    app.router.add_get('/auteurs/{idx}', auteur)
+    return app
+
+
+async def run(base_url: str, requests: int, workers: int, rate: float, burst: int) -> tuple[float, dict]:
+    api = ApiRootMe()
+    #The stub host falls back to the default lane
+    api.lanes[API_DEFAULT_HOST] = Lane(API_DEFAULT_HOST, workers, rate, burst)
+    tasks = api.start_workers()
+
+    start = time.perf_counter()
+    #Different users, so that no request is coalesced
+    await asyncio.gather(*(api.get(f"{base_url}/auteurs/{idx}", {}, timeout=600) for idx in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await api.session.close()
+    api.cache.executor.shutdown()
+    api.decoder.executor.shutdown()
+
+    return elapsed, api.stats
+
+
+async def main(args) -> None:
+    runner = web.AppRunner(stub_app(args.latency / 1000, args.throttle))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    workers, rate, burst = API_LANES[API_DEFAULT_HOST]
+    runs = {
+        'fixed 0.5s delay, 1 worker': (1, 2, 1),
+        f'configured lane ({workers} workers, {rate} req/s, burst {burst})': (workers, rate, burst),
+        f'{args.workers} workers, {args.rate} req/s, burst {args.burst}': (args.workers, args.rate, args.burst),
+        }
+
+    print(f"{args.requests} requests, {args.latency} ms latency, {args.throttle * 100:.0f}% throttled")
+    for name, budget in runs.items():
+        elapsed, stats = await run(base_url, args.requests, *budget)
+        print(f"{name:<50} {args.requests / elapsed:7.1f} req/s  ({stats['requests']} sent, {stats['throttled']} throttled, {elapsed:.1f}s)")
+
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=50, help="stub answer time in ms")
+    parser.add_argument('--throttle', type=float, default=0.0, help="fraction of answers that are 429")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=50)
+    parser.add_argument('--burst', type=int, default=16)
+    args = parser.parse_args()
+
+    #Keep the response cache of the bot untouched
+    fetch.CACHE_PATH = os.path.join(tempfile.mkdtemp(), 'cache.db')
+    asyncio.run(main(args))
@@ -0,0 +1,78 @@
+"""Query plans and timings of the !today and !graph queries on a synthetic database:
+SUBSTR(v.date) filters, the indexed validations.day column, and the daily_scores rollup
+
+    python benchmarks/day_queries.py --users 10000 --validations 30
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from synthetic import NOW, create_database
+
+from sqlalchemy.sql import text
+
+from database.models.validation_model import epoch_day
+
+QUERIES = {
+    'today': {
+        'substr': "select a.username,sum(c.score) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)==:today_date and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1;",
+        'day': "select a.username,sum(c.score) from validations as v,auteurs as a, challenges as c where v.day = :today and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1;",
+        'rollup': "select a.username,sum(d.points) from daily_scores as d,auteurs as a where d.day = :today and d.auteur_id==a.idx group by 1;",
+        },
+    'range': {
+        'substr': "select a.username,sum(c.score),SUBSTR(v.date,0,11) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)>=:start_date and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1,3;",
+        'day': "select a.username,sum(c.score),date(v.day * 86400, 'unixepoch') from validations as v,auteurs as a, challenges as c where v.day >= :start and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1,v.day;",
+        'rollup': "select a.username,sum(d.points),date(d.day * 86400, 'unixepoch') from daily_scores as d,auteurs as a where d.day >= :start and d.auteur_id==a.idx group by 1,d.day;",
+        },
+    'range_sum': {
+        'substr': "select a.username,sum(c.score) from validations as v,auteurs as a, challenges as c where SUBSTR(v.date,0,11)>=:start_date and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1;",
+        'day': "select a.username,sum(c.score) from validations as v,auteurs as a, challenges as c where v.day >= :start and v.auteur_id==a.idx and v.challenge_id==c.idx group by 1;",
+        'rollup': "select a.username,sum(d.points) from daily_scores as d,auteurs as a where d.day >= :start and d.auteur_id==a.idx group by 1;",
+        },
+    }
+
+
+def main(args) -> None:
+    directory = tempfile.mkdtemp()
+
+    print(f"Creating {args.users} users with about {args.validations} validations each...")
+    engine, _ = create_database(os.path.join(directory, 'rootme.db'), args.users, args.challenges, args.validations)
+
+    start = NOW - timedelta(days=args.days)
+    params = {'today': epoch_day(NOW), 'today_date': NOW.strftime('%Y-%m-%d'), 'start': epoch_day(start), 'start_date': start.strftime('%Y-%m-%d')}
+
+    with engine.connect() as conn:
+        print(f"{conn.exec_driver_sql('select count(*) from validations').scalar()} validations, {args.days} days range\n")
+
+        for name, variants in QUERIES.items():
+            results = {}
+            for variant, sql in variants.items():
+                plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)]
+
+                timings = []
+                for _ in range(args.runs):
+                    begin = time.perf_counter()
+                    results[variant] = sorted(tuple(row) for row in conn.execute(text(sql), params))
+                    timings.append(time.perf_counter() - begin)
+
+                print(f"{name:<10} {variant:<7} {statistics.median(timings) * 1000:8.1f} ms  {len(results[variant])} rows  | {' / '.join(plan)}")
+
+            same = all(result == results['substr'] for result in results.values())
+            print(f"{name:<10} same rows for every variant: {same}\n")
+
+    engine.dispose()
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--challenges', type=int, default=600)
+    parser.add_argument('--validations', type=int, default=30, help="average validations per user")
+    parser.add_argument('--days', type=int, default=30, help="length of the !graph range")
+    parser.add_argument('--runs', type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,124 @@
+"""Write throughput of a poll cycle on a synthetic 10k users database:
+one ORM merge per user and transaction, as update_user used to do, against one PollBatch
+
+    python benchmarks/poll_write.py --users 10000 --changed 1000 --new 2
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from synthetic import connect, create_database, random_date
+
+from sqlalchemy.orm import sessionmaker
+
+from database.batch import PollBatch
+from database.models.auteur_model import Auteur
+from database.models.challenge_model import Challenge
+from database.models.validation_model import Validation, epoch_day
+
+
+def poll_cycle(solves: dict, challenges: int, changed: int, new: int, new_challenges: int, seed=1) -> dict[int, list[tuple[int, object]]]:
+    """New (challenge, date) solved by `changed` random users, some of them on challenges not in database yet"""
+    rng = random.Random(seed)
+    unknown = list(range(challenges + 1, challenges + new_challenges + 1))
+
+    cycle = {}
+    for idx in rng.sample(sorted(solves), changed):
+        solved = {chall for chall, _ in solves[idx]}
+        candidates = [chall for chall in range(1, challenges + 1) if chall not in solved]
+        picked = rng.sample(candidates, min(new, len(candidates)))
+        if unknown and rng.random() < 0.1:
+            picked[-1:] = [rng.choice(unknown)]
+        cycle[idx] = [(chall, random_date(rng)) for chall in picked]
+    return cycle
+
+
+def full_challenge(idx: int) -> Challenge:
+    return Challenge(idx=idx, title=f'Challenge {idx}', category='Web - Client', description='', score=20, difficulty='Facile', date=random_date(random.Random(idx)))
+
+
+def write_merge(session_maker, solves: dict, cycle: dict) -> None:
+    """Former path: each user payload merged as an ORM graph, with all its validations, in its own transaction"""
+    known = set()
+    with session_maker.begin() as session:
+        known.update(idx for idx, in session.query(Challenge.idx))
+
+    for idx, new_solves in cycle.items():
+        with session_maker.begin() as session:
+            for chall, _ in new_solves:
+                if chall not in known:
+                    #Missing challenges were fetched and stored one by one
+                    session.merge(full_challenge(chall))
+                    known.add(chall)
+
+            aut = Auteur(idx=idx, username=f'user{idx}', score=idx, rank=str(idx))
+            for chall, date in solves[idx] + new_solves:
+                v = Validation(idx=f'{idx}-{chall}', date=date, day=epoch_day(date))
+                v.validation_auteur = aut
+                v.validation_challenge = Challenge(idx=chall)
+            session.merge(aut)
+
+
+def write_batch(session_maker, solves: dict, cycle: dict) -> None:
+    """Current path: the whole cycle collected in a PollBatch and written in one set-based transaction"""
+    with session_maker.begin() as session:
+        known = {idx for idx, in session.query(Challenge.idx)}
+
+    batch = PollBatch()
+    for idx, new_solves in cycle.items():
+        everything = solves[idx] + new_solves
+        aut = Auteur(idx=idx, username=f'user{idx}', score=idx, rank=str(idx))
+        aut.watermark = (str(max(date for _, date in everything)), len(everything))
+        aut.fingerprint = f'{aut.score}:{aut.rank}:{aut.watermark}'
+        batch.add_auteur(aut, True)
+
+        for chall, date in new_solves:
+            if chall not in known and chall not in batch.challenges:
+                batch.add_challenge(full_challenge(chall))
+            batch.add_validation(f'{idx}-{chall}', idx, chall, date)
+
+    with session_maker.begin() as session:
+        batch.write(session)
+
+
+def main(args) -> None:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'rootme.db')
+
+    print(f"Creating {args.users} users with about {args.validations} validations each...")
+    engine, solves = create_database(path, args.users, args.challenges, args.validations)
+    engine.dispose()
+    cycle = poll_cycle(solves, args.challenges, args.changed, args.new, args.new_challenges)
+    new_validations = sum(len(new_solves) for new_solves in cycle.values())
+    print(f"Poll cycle: {len(cycle)} users with {new_validations} new validations")
+
+    for name, write in (('merge per user', write_merge), ('PollBatch', write_batch)):
+        copy = os.path.join(directory, f'{write.__name__}.db')
+        shutil.copy(path, copy)
+        engine = connect(copy)
+        session_maker = sessionmaker(engine, expire_on_commit=False)
+
+        start = time.perf_counter()
+        write(session_maker, solves, cycle)
+        elapsed = time.perf_counter() - start
+
+        with engine.connect() as conn:
+            count = conn.exec_driver_sql("select count(*) from validations").scalar()
+        print(f"{name:<16} {elapsed:7.2f}s  {len(cycle) / elapsed:8.0f} users/s  {new_validations / elapsed:8.0f} validations/s  ({count} validations stored)")
+        engine.dispose()
+
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--challenges', type=int, default=600)
+    parser.add_argument('--validations', type=int, default=30, help="average validations per user")
+    parser.add_argument('--changed', type=int, default=1000, help="users with new validations in the cycle")
+    parser.add_argument('--new', type=int, default=2, help="new validations per changed user")
+    parser.add_argument('--new-challenges', type=int, default=20, help="challenges of the cycle not in database yet")
+    main(parser.parse_args())
@@ -0,0 +1,89 @@
+"""ScoreIndex against the SQL queries it replaced, on a synthetic database of 50k authors:
+who is directly above a user, its rank, the top N and the whole ranking
+
+    python benchmarks/score_index.py --users 50000 --lookups 3000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from synthetic import create_database
+
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from database.models.auteur_model import Auteur
+from database.score_index import ScoreIndex
+
+
+def timed(call, calls: list) -> tuple[float, list]:
+    """Microseconds per call, and the results"""
+    start = time.perf_counter()
+    results = [call(*args) for args in calls]
+    return (time.perf_counter() - start) / len(calls) * 1e6, results
+
+
+def main(args) -> None:
+    rng = random.Random(2)
+    directory = tempfile.mkdtemp()
+
+    print(f"Creating {args.users} users...")
+    engine, _ = create_database(os.path.join(directory, 'rootme.db'), args.users, args.challenges, args.validations)
+    session = sessionmaker(engine)()
+
+    start = time.perf_counter()
+    index = ScoreIndex(session.query(Auteur.idx, Auteur.username, Auteur.score).all())
+    print(f"Index of {len(index)} users loaded in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+    scores = {idx: score for idx, (_, score) in index.users.items()}
+    users = [(idx,) for idx in rng.sample(sorted(scores), args.lookups)]
+
+    def sql_above(idx: int) -> int:
+        res = session.query(Auteur.username, Auteur.score).filter(Auteur.score > scores[idx]).order_by(Auteur.score.asc()).limit(1).one_or_none()
+        return res[1] if res else 0
+
+    def sql_rank(idx: int) -> int:
+        return session.query(func.count(Auteur.idx)).filter(Auteur.score > scores[idx]).scalar() + 1
+
+    def sql_top(n: int) -> list:
+        return [score for _, score in session.query(Auteur.username, Auteur.score).order_by(Auteur.score.desc()).limit(n)]
+
+    def sql_ranking() -> list:
+        #The scoreboard command loaded every member and sorted them in Python
+        members = session.query(Auteur).all()
+        members.sort(key=lambda x: x.score or 0, reverse=True)
+        return [member.score or 0 for member in members]
+
+    comparisons = (
+        ('above', sql_above, lambda idx: index.above(idx)[1], users),
+        ('rank', sql_rank, index.rank, users),
+        (f'top {args.top}', sql_top, lambda n: [score for _, score in index.top(n)], [(args.top,)] * 100),
+        ('ranking', sql_ranking, lambda: [score for _, score in index.top()], [()] * 5),
+        )
+
+    for name, sql, indexed, calls in comparisons:
+        sql_time, sql_results = timed(sql, calls)
+        index_time, index_results = timed(indexed, calls)
+        #Users with the same score can come in any order, the scores must match
+        print(f"{name:<8} SQL {sql_time:10.1f} us  index {index_time:8.1f} us  x{sql_time / index_time:7.0f}  same results: {sql_results == index_results}")
+
+    updates = [(idx, f'user{idx}', scores[idx] + rng.randrange(5, 100)) for idx, in users]
+    update_time, _ = timed(index.update, updates)
+    print(f"\nupdate   index {update_time:8.1f} us per moved user")
+
+    session.close()
+    engine.dispose()
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--challenges', type=int, default=600)
+    parser.add_argument('--validations', type=int, default=10, help="average validations per user")
+    parser.add_argument('--lookups', type=int, default=3000)
+    parser.add_argument('--top', type=int, default=50)
+    main(parser.parse_args())
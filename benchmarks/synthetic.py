@@ -0,0 +1,68 @@
+"""Synthetic rootme.db shared by the database benchmarks"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RootMeBot'))
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import Engine
+
+from database.manager import DatabaseManager
+from database.migrations import migrate
+from database.models.auteur_model import Auteur
+from database.models.base_model import Base
+from database.models.challenge_model import Challenge
+from database.models.validation_model import Validation, epoch_day
+
+CATEGORIES = ['Web - Client', 'Web - Serveur', 'App - Script', 'App - Systeme', 'Cryptanalyse', 'Forensic', 'Programmation', 'Realiste', 'Reseau', 'Steganographie', 'Cracking']
+SCORES = [5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 70, 80, 90]
+#Validations are spread over the two years before this date
+NOW = datetime(2026, 10, 18, 12, 0, 0)
+
+
+def connect(path: str) -> Engine:
+    """Engine with the SQLite profile of the bot"""
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, 'connect', DatabaseManager.set_pragmas)
+    return engine
+
+
+def random_date(rng: random.Random) -> datetime:
+    return (NOW - timedelta(seconds=rng.randrange(2 * 365 * 86400))).replace(microsecond=0)
+
+
+def create_database(path: str, users: int, challenges: int, validations_per_user: int, seed=0) -> tuple[Engine, dict[int, list[tuple[int, datetime]]]]:
+    """Creates a migrated database, and returns it with the (challenge, date) solved by each user"""
+    rng = random.Random(seed)
+    engine = connect(path)
+    Base.metadata.create_all(bind=engine)
+
+    challenge_rows = [
+        {'idx': idx, 'title': f'Challenge {idx}', 'category': rng.choice(CATEGORIES), 'description': '', 'score': rng.choice(SCORES), 'difficulty': 'Facile', 'date': random_date(rng)}
+        for idx in range(1, challenges + 1)
+        ]
+
+    solves = {}
+    validation_rows = []
+    for idx in range(1, users + 1):
+        count = min(challenges, max(0, int(rng.expovariate(1 / validations_per_user))))
+        solves[idx] = sorted(((chall, random_date(rng)) for chall in rng.sample(range(1, challenges + 1), count)), key=lambda solve: solve[1])
+        validation_rows += [{'idx': f'{idx}-{chall}', 'auteur_id': idx, 'challenge_id': chall, 'date': date, 'day': epoch_day(date)} for chall, date in solves[idx]]
+
+    scores = {chall['idx']: chall['score'] for chall in challenge_rows}
+    auteur_rows = [
+        {'idx': idx, 'username': f'user{idx}', 'score': sum(scores[chall] for chall, _ in solves[idx]), 'rank': str(idx)}
+        for idx in range(1, users + 1)
+        ]
+
+    with engine.begin() as conn:
+        conn.execute(insert(Challenge.__table__), challenge_rows)
+        conn.execute(insert(Auteur.__table__), auteur_rows)
+        conn.execute(insert(Validation.__table__), validation_rows)
+
+    #The migrations build the rollups from the validations
+    migrate(engine)
+
+    return engine, solves